@@ -2,6 +2,7 @@
 #  Date   : 13 April 2018          
         
 import sys
+import collections
 import numpy as np
 
 debug = False
@@ -50,19 +51,41 @@ class Pool:
 class Acceptor:
     def __init__(self,values):
         """
-        Construct the acceptor preferences
+        Construct the acceptor preferences and the table of preference numbers
         """
         self.values = values
+        self.ranks = self.build_ranks(values)
+
+    def build_ranks(self,values):
+        """
+        Return a table with a row per acceptor and a column per proposer holding the preference number of the proposer (first listing wins), 0 if not listed
+        """
+        width = max([len(values)]+[max(row) for row in values if len(row)>0])
+        longest = max([0]+[len(row) for row in values])
+        ranks = np.zeros(shape=(len(values),width+1),dtype=np.min_scalar_type(longest))
+        for acceptor in range(len(values)):
+            for position in reversed(range(len(values[acceptor]))):
+                ranks[acceptor,values[acceptor][position]] = position+1
+        return ranks
 
     def get_preference_number(self,acceptor,proposer):
         """
         Return the preference of the acceptor for the proposer passed
         """
-        #print(self.values[acceptor-1])
-        if proposer in self.values[acceptor-1]:
-            return self.values[acceptor-1].index(proposer)+1
-        else: 
+        if np.isnan(proposer) or not (0<proposer<self.ranks.shape[1]):
             return 0
+        return int(self.ranks[acceptor-1,int(proposer)])
+
+    def get_preference_numbers(self,acceptors,proposers):
+        """
+        Return the preferences for many acceptor and proposer pairs at once (0 where not listed)
+        """
+        acceptors = np.asarray(acceptors,dtype=np.int64)
+        proposers = np.asarray(proposers,dtype=np.float64)
+        listed = (~np.isnan(proposers)) & (proposers>0) & (proposers<self.ranks.shape[1])
+        result = np.zeros(shape=len(acceptors),dtype=self.ranks.dtype)
+        result[listed] = self.ranks[acceptors[listed]-1,proposers[listed].astype(np.int64)]
+        return result
 
     def is_proposal_accepted(self,acceptor,proposer):
         """
@@ -95,6 +118,67 @@ class Proposer:
         #return self.values.iloc[proposer,iteration]
         return self.values[proposer][iteration]
 
+# CapacityPool Class :: holds the engagements when each acceptor takes up to its capacity of proposers
+class CapacityPool(Pool):
+    def __init__(self, proposers, capacities):
+        """
+        Construct the engagement of each proposer (the acceptor, NaN if not engaged) and the list of proposers held by each acceptor
+        """
+        Pool.__init__(self, proposers)
+        self.capacities = list(capacities)
+        self.held = [[] for capacity in self.capacities]
+
+    def new_engagement(self,acceptor,proposer,released=None):
+        """
+        Engage the proposer to the acceptor, first releasing the proposer passed as released (if any) from the acceptor
+        """
+        if released is not None:
+            if debug: print(released, "released by", acceptor)
+            self.held[acceptor-1].remove(released)
+            self.engagements[released-1] = np.nan
+
+        self.held[acceptor-1].append(proposer)
+        self.engagements[proposer-1] = acceptor
+
+    def is_full(self,acceptor):
+        """
+        Return True if the acceptor holds as many proposers as its capacity
+        """
+        return len(self.held[acceptor-1])>=self.capacities[acceptor-1]
+
+    def get_held(self,acceptor):
+        """
+        Return the proposers held by the acceptor
+        """
+        return self.held[acceptor-1]
+
+    def get_groups(self):
+        """
+        Return each acceptor with the proposers it holds (in order of proposer), one list per acceptor holding any
+        """
+        return [[acceptor+1]+sorted(self.held[acceptor]) for acceptor in range(len(self.held)) if self.held[acceptor]]
+
+# CapacityAcceptor Class :: acceptor preferences when each acceptor takes several proposers
+class CapacityAcceptor(Acceptor):
+    def get_worst_held(self,acceptor,pool_object):
+        """
+        Return the proposer held by the acceptor that the acceptor likes least
+        """
+        return max(pool_object.get_held(acceptor),key=lambda proposer: self.get_preference_number(acceptor,proposer))
+
+    def is_proposal_accepted(self,acceptor,proposer,pool_object):
+        """
+        If the acceptor lists the proposer and has room, or likes the proposer more than one it holds, return true else return false
+        """
+        preference_number = self.get_preference_number(acceptor,proposer)
+        if debug: print("acceptor preference of proposal", preference_number)
+
+        if (preference_number==0) or (pool_object.capacities[acceptor-1]<=0):
+            return False
+        if not pool_object.is_full(acceptor):
+            return True
+        return preference_number < self.get_preference_number(acceptor,self.get_worst_held(acceptor,pool_object))
+
 # Create dummy data
 acceptors_table = [[1,2,3,4],[3,4,1,2],[4,2,3,1],[3,2,1,4]]
 proposers_table = [[2,1,3,4],[4,1,2,3],[1,3,2,4],[2,3,1,4]]
@@ -128,3 +212,33 @@ def stable_marriage():
 
 print("\n FINAL ENGAGEMENTS:", stable_marriage())
 
+def stable_groups(proposer_object,accepter_object,pool_object):
+    """
+    Many-to-one (hospitals/residents): each free proposer proposes down its list, an acceptor holds up to its capacity and releases
+    the proposer it likes least when full. One pass gives the groups of each acceptor with its proposers
+    """
+    next_choice = [0]*len(proposer_object.values)
+    free = collections.deque(range(len(proposer_object.values)))
+    while free:
+        proposer = free.popleft()
+        if next_choice[proposer]>=len(proposer_object.values[proposer]):
+            continue #proposer has been rejected by every acceptor listed
+        acceptor = proposer_object.get_proposal(proposer,next_choice[proposer])
+        next_choice[proposer] += 1
+        if debug: print("PROPOSAL:", proposer+1, "---->", acceptor)
+
+        if accepter_object.is_proposal_accepted(acceptor,proposer+1,pool_object):
+            released = accepter_object.get_worst_held(acceptor,pool_object) if pool_object.is_full(acceptor) else None
+            pool_object.new_engagement(acceptor,proposer+1,released)
+            if released is not None:
+                free.append(released-1)
+        else:
+            free.append(proposer)
+
+    return pool_object.get_groups()
+
+# Groups of up to max_set_size: each acceptor takes up to max_set_size-1 proposers
+max_set_size = 3
+capacity_accepter_object = CapacityAcceptor(acceptors_table)
+capacity_pool_object = CapacityPool(proposers_table,[max_set_size-1]*len(acceptors_table))
+print("\n FINAL GROUPS (acceptor then proposers):", stable_groups(proposer_object,capacity_accepter_object,capacity_pool_object))
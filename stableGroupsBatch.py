@@ -0,0 +1,105 @@
+"""
+#
+#  Batch mode for stableGroupsX4: match every cohort of a directory or manifest in a pool of worker
+#  processes, each cohort writing its own pools/sets/log files
+#
+"""
+
+import sys
+import os
+import time
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import stableGroupsX4 as sg
+
+def list_cohorts(source):
+    """
+    Return the preference files of a directory (every .csv, sorted) or of a manifest (one path per line, # comments, relative to the manifest)
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source,name) for name in sorted(os.listdir(source)) if name.lower().endswith(".csv")]
+    with open(source) as manifest:
+        lines = [line.strip() for line in manifest]
+    base = os.path.dirname(os.path.abspath(source))
+    return [os.path.join(base,line) for line in lines if line and not line.startswith("#")]
+
+def output_names(input_files,output_dir):
+    """
+    Return the output prefix of each cohort: the file name without extension, numbered (stem_1, stem_2 ...) when two cohorts share
+    a name, skipping any number already taken by another cohort
+    """
+    stems = [os.path.splitext(os.path.basename(input_file))[0] for input_file in input_files]
+    taken = set(stem for stem in stems if stems.count(stem)==1)
+    prefixes = []
+    for stem in stems:
+        name = stem
+        if stems.count(stem)>1:
+            number = 1
+            while "{}_{}".format(stem,number) in taken:
+                number += 1
+            name = "{}_{}".format(stem,number)
+        taken.add(name)
+        prefixes.append(os.path.join(output_dir,name))
+    return prefixes
+
+def run_cohort(input_file,prefix,iteration,no_of_preferences,max_set_size):
+    """
+    Match one cohort, sending its console output to prefix.log. Return the outcome, with the traceback if it failed
+    """
+    start = time.perf_counter()
+    result = {"input_file": input_file, "prefix": prefix, "error": None, "sets": None}
+    with open(prefix+".log","w") as log, contextlib.redirect_stdout(log):
+        try:
+            result["sets"] = sg.run(input_file,iteration,no_of_preferences,max_set_size,prefix+"_pools.csv",prefix+"_sets.csv")
+        except Exception:
+            result["error"] = traceback.format_exc()
+            print(result["error"])
+    result["seconds"] = time.perf_counter()-start
+    return result
+
+def run_batch(input_files,output_dir,iteration,no_of_preferences,max_set_size,workers=None):
+    """
+    Match the cohorts in a pool of worker processes and return their outcomes in input order. A failing
+    cohort (or a crashed worker) is reported in its outcome and does not stop the others
+    """
+    os.makedirs(output_dir,exist_ok=True)
+    prefixes = output_names(input_files,output_dir)
+    results = [None]*len(input_files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_cohort,input_file,prefix,iteration,no_of_preferences,max_set_size): i for i,(input_file,prefix) in enumerate(zip(input_files,prefixes))}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as error:
+                results[i] = {"input_file": input_files[i], "prefix": prefixes[i], "error": repr(error), "sets": None, "seconds": None}
+            print("{} {}".format(input_files[i],"failed" if results[i]["error"] else "done"))
+    return results
+
+def main():
+    try:
+        source = sys.argv[1]
+        output_dir = sys.argv[2]
+        iteration = int(sys.argv[3])
+        no_of_preferences = int(sys.argv[4])
+        max_set_size = int(sys.argv[5])
+        workers = int(sys.argv[6]) if len(sys.argv)>6 else None
+    except (IndexError, ValueError):
+        print("stableGroupsBatch.py [directory_or_manifest] [output_dir] [iteration] [no_of_preferences] [max_set_size] [workers]\n")
+        sys.exit()
+
+    input_files = list_cohorts(source)
+    start = time.perf_counter()
+    results = run_batch(input_files,output_dir,iteration,no_of_preferences,max_set_size,workers)
+    seconds = time.perf_counter()-start
+
+    failed = [result for result in results if result["error"]]
+    print("\n {} cohorts in {:.2f}s ({:.2f} cohorts/s), {} failed".format(len(results),seconds,len(results)/seconds if seconds else 0.0,len(failed)))
+    for result in failed:
+        print(" {}: see {}.log".format(result["input_file"],result["prefix"]))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+#
+#  Synthetic cohorts and timings for the stableGroupsX4 matching pipeline
+#
+"""
+
+import sys
+import os
+import io
+import csv
+import json
+import time
+import platform
+import tempfile
+import contextlib
+import numpy as np
+import stableGroupsX4 as sg
+
+def generate_cohort(output_file,size,no_of_preferences,seed=0,skew=0.0,null_rate=0.05):
+    """
+    Write a cohort of size members (plus the null member, last) in the import_preferences format. Each member lists
+    no_of_preferences names drawn with popularity proportional to 1/rank**skew (0 for uniform); each listing is "null"
+    with probability null_rate. The same arguments always give the same file
+    """
+    rng = np.random.default_rng(seed)
+    names = ["member{}".format(i+1) for i in range(size)]+["null"]
+
+    popularity = 1.0/np.arange(1,size+1)**skew
+    popularity = np.cumsum(popularity[rng.permutation(size)])
+    popularity /= popularity[-1]
+
+    with open(output_file,"w",newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["name"]+["preference{}".format(i+1) for i in range(no_of_preferences)])
+        for start in range(0,size,10000):
+            rows = min(10000,size-start)
+            choices = np.searchsorted(popularity,rng.random(size=(rows,no_of_preferences)),side="right")
+            choices[rng.random(size=(rows,no_of_preferences))<null_rate] = size #null
+            for i in range(rows):
+                writer.writerow([names[start+i]]+[names[choice] for choice in choices[i]])
+        writer.writerow(["null"]+["null"]*no_of_preferences)
+    return names
+
+def time_call(function,*args):
+    """
+    Return the wall time of the call (printing suppressed) and its result
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function(*args)
+        return time.perf_counter()-start,result
+
+def benchmark_size(input_file,size,no_of_preferences,iteration,max_set_size,legacy_limit=200,dense_limit=10000,samples=1000):
+    """
+    Time each stage of the pipeline on the cohort in input_file and return the timings (seconds) as a dictionary. The matching
+    uses the sparse preferences, the dense rank table (N x N) is only timed up to dense_limit members
+    """
+    result = {"size": size, "no_of_preferences": no_of_preferences, "iteration": iteration, "max_set_size": max_set_size}
+
+    result["import_preferences"],(preferences,names) = time_call(sg.import_preferences,input_file)
+    result["encode_preferences"],encoded = time_call(sg.encode_preferences,preferences,names,no_of_preferences)
+    result["read_preferences"],(encoded,names) = time_call(sg.read_preferences,input_file,no_of_preferences)
+    del preferences
+
+    null_position = sg.return_null_position(names)
+    result["sparse_preferences"],sparse = time_call(sg.sparse_preferences,encoded,null_position)
+    result["read_sparse_preferences"],_ = time_call(sg.read_sparse_preferences,input_file,no_of_preferences)
+    if size<=dense_limit:
+        result["acceptor_dense"],_ = time_call(sg.Acceptor,encoded)
+    result["acceptor"],accepter_object = time_call(sg.Acceptor,sparse)
+    proposer_object = sg.Proposer(sparse)
+
+    # one pass of each engine on an empty history
+    for engine in sorted(sg.pair_engines):
+        result["stable_pairs_"+engine],pool_object = time_call(sg.pair_engines[engine],sg.Pool(encoded),sg.Pools(),proposer_object,sparse,accepter_object,sparse,no_of_preferences,null_position,False,max_set_size,names)
+
+    pools_object = sg.Pools()
+    result["stable_marriage"],_ = time_call(sg.stable_marriage,pools_object,proposer_object,sparse,accepter_object,sparse,iteration,no_of_preferences,null_position,max_set_size,names,"queue")
+
+    # mean time of a set size check against the full history
+    rng = np.random.default_rng(0)
+    pool_object = sg.Pool(encoded)
+    checks = [(int(rng.integers(len(encoded)-1)),int(rng.integers(no_of_preferences))) for i in range(samples)]
+    start = time.perf_counter()
+    for proposer,preference in checks:
+        sg.is_set_size_allowed(sparse,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size)
+    result["is_set_size_allowed"] = (time.perf_counter()-start)/samples
+
+    result["build_pairs"],pairs = time_call(sg.build_pairs,names,pools_object)
+    result["build_groups_from_pools"],groups = time_call(sg.build_groups_from_pools,names,pools_object)
+    result["groups"] = len(groups)
+    if size<=legacy_limit:
+        result["build_groups"],_ = time_call(sg.build_groups,names,pairs,pools_object)
+    return result
+
+def run_benchmarks(sizes=(10,100,1000,10000,100000),no_of_preferences=5,iteration=2,max_set_size=12,skew=0.0,seed=0,label=""):
+    """
+    Generate a cohort for each size, time the pipeline on it and return the report
+    """
+    report = {"label": label, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "numpy": np.__version__, "results": []}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            input_file = os.path.join(directory,"cohort{}.csv".format(size))
+            generate_cohort(input_file,size,no_of_preferences,seed,skew)
+            report["results"].append(benchmark_size(input_file,size,no_of_preferences,iteration,max_set_size))
+            print("size {} done".format(size))
+    return report
+
+def main():
+    output_file = sys.argv[1] if len(sys.argv)>1 else "benchmark.json"
+    label = sys.argv[2] if len(sys.argv)>2 else ""
+    sizes = [int(size) for size in sys.argv[3].split(",")] if len(sys.argv)>3 else (10,100,1000,10000,100000)
+
+    report = run_benchmarks(sizes,label=label)
+    with open(output_file,"w") as jsonfile:
+        json.dump(report,jsonfile,indent=1)
+    print("\n Benchmark written to {}".format(output_file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+#
+#  Local matching service for stableGroupsX4: cohorts are read and encoded once and kept in memory, match requests
+#  run in a pool of worker processes and the answers are kept in an LRU cache. Requests and responses are JSON lines
+#  over a Unix socket (or TCP on localhost when a port number is given)
+#
+#  {"op": "load", "cohort": "maths", "input_file": "maths.csv"}
+#  {"op": "match", "cohort": "maths", "iteration": 2, "no_of_preferences": 5, "max_set_size": 12}
+#  {"op": "cohorts"}
+#
+"""
+
+import sys
+import io
+import json
+import asyncio
+import contextlib
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import stableGroupsX4 as sg
+
+def match_table(table,names,iteration,no_of_preferences,max_set_size):
+    """
+    Match the encoded preferences (run in a worker process) and return the engagements of each pool and the groups
+    """
+    null_position = sg.return_null_position(names)
+    preferences = sg.sparse_preferences(table,null_position)
+    pools_object = sg.Pools()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sg.stable_marriage(pools_object,sg.Proposer(preferences),preferences,sg.Acceptor(preferences),preferences,iteration,no_of_preferences,null_position,max_set_size,names,"queue")
+    return {"pools": [pools_object.get_pool_object(i).get_partners().tolist() for i in range(pools_object.length())],
+            "groups": sg.build_groups_from_pools(names,pools_object)}
+
+# MatchService Class :: encoded cohorts, result cache and the request handler
+class MatchService:
+    def __init__(self, executor, cache_size=128):
+        """
+        Construct the service with the executor the matches run in and the number of results to cache
+        """
+        self.executor = executor
+        self.cache_size = cache_size
+        self.cohorts = {} #cohort id: (sparse preferences, names)
+        self.cache = collections.OrderedDict() #match key: result, least recently used first
+        self.running = {} #match key: future of a match in progress, shared by identical requests
+
+    def load_cohort(self,cohort,input_file):
+        """
+        Read and encode the preferences of a cohort (every preference of each row) and keep them under the cohort id
+        """
+        preferences,names = sg.read_sparse_preferences(input_file)
+        self.cohorts[cohort] = (preferences,names)
+        return len(names)
+
+    async def match(self,cohort,iteration,no_of_preferences,max_set_size):
+        """
+        Return the result of matching the cohort with the parameters passed, from the cache if the same preferences were matched before
+        """
+        if cohort not in self.cohorts:
+            raise ValueError("unknown cohort {}".format(cohort))
+        preferences,names = self.cohorts[cohort]
+        table = preferences.to_table(no_of_preferences)
+        key = sg.match_key(table,names,iteration,no_of_preferences,max_set_size)
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key],True
+        if key not in self.running:
+            loop = asyncio.get_running_loop()
+            self.running[key] = loop.run_in_executor(self.executor,match_table,table,names,iteration,no_of_preferences,max_set_size)
+        try:
+            result = await self.running[key]
+        finally:
+            self.running.pop(key,None)
+
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache)>self.cache_size:
+            self.cache.popitem(last=False)
+        return result,False
+
+    async def respond(self,request):
+        """
+        Return the response to one request
+        """
+        op = request.get("op")
+        if op=="load":
+            loop = asyncio.get_running_loop()
+            members = await loop.run_in_executor(None,self.load_cohort,request["cohort"],request["input_file"])
+            return {"cohort": request["cohort"], "members": members}
+        if op=="match":
+            result,cached = await self.match(request["cohort"],int(request["iteration"]),int(request["no_of_preferences"]),int(request["max_set_size"]))
+            return dict(result,cohort=request["cohort"],cached=cached)
+        if op=="cohorts":
+            return {"cohorts": {cohort: len(self.cohorts[cohort][1]) for cohort in self.cohorts}}
+        raise ValueError("unknown op {}".format(op))
+
+    async def handle(self,reader,writer):
+        """
+        Answer the JSON line requests of a connection until it is closed, an error is returned as {"error": ...}
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.respond(json.loads(line))
+                except Exception as error:
+                    response = {"error": "{}: {}".format(type(error).__name__,error)}
+                writer.write(json.dumps(response).encode()+b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+async def serve(address,cohorts,workers=None,cache_size=128):
+    """
+    Load the cohorts (cohort id: input file) and answer requests on the Unix socket path, or the TCP port on localhost, until cancelled
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        service = MatchService(executor,cache_size)
+        for cohort,input_file in cohorts.items():
+            service.load_cohort(cohort,input_file)
+        if str(address).isdigit():
+            server = await asyncio.start_server(service.handle,"127.0.0.1",int(address))
+        else:
+            server = await asyncio.start_unix_server(service.handle,address)
+        print("Serving {} cohorts on {}".format(len(service.cohorts),address))
+        async with server:
+            await server.serve_forever()
+
+def main():
+    try:
+        address = sys.argv[1]
+        cohorts = dict(argument.split("=",1) for argument in sys.argv[2:])
+    except (IndexError, ValueError):
+        print("stableGroupsServer.py [socket_path or port] [cohort_id=input_file ...]\n")
+        sys.exit()
+
+    try:
+        asyncio.run(serve(address,cohorts))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
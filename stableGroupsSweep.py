@@ -0,0 +1,101 @@
+"""
+#
+#  Parameter sweep for stableGroupsX4: the preferences are read and encoded once and shared
+#  with the worker processes, each worker matches one (iteration, no_of_preferences, max_set_size)
+#
+"""
+
+import sys
+import io
+import csv
+import time
+import itertools
+import contextlib
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import stableGroupsX4 as sg
+
+# encoded preferences and names of the cohort in each worker process
+shared = {}
+
+def attach_preferences(memory_name,shape,names):
+    """
+    Worker initialiser: map the encoded preferences from shared memory (read only) and keep the names
+    """
+    try:
+        memory = shared_memory.SharedMemory(name=memory_name,track=False)
+    except TypeError: #Python < 3.13 always registers the block with the resource tracker
+        memory = shared_memory.SharedMemory(name=memory_name)
+    preferences = np.ndarray(shape=shape,dtype=np.int32,buffer=memory.buf)
+    preferences.flags.writeable = False
+    shared["memory"] = memory
+    shared["preferences"] = preferences
+    shared["names"] = names
+
+def run_combination(iteration,no_of_preferences,max_set_size):
+    """
+    Match the shared cohort with the parameters passed and return the summary of the groups found
+    """
+    names = shared["names"]
+    null_position = sg.return_null_position(names)
+    preferences = sg.sparse_preferences(np.ascontiguousarray(shared["preferences"][:,:no_of_preferences]),null_position)
+
+    start = time.perf_counter()
+    pools_object = sg.Pools()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sg.stable_marriage(pools_object,sg.Proposer(preferences),preferences,sg.Acceptor(preferences),preferences,iteration,no_of_preferences,null_position,max_set_size,names,"queue")
+    groups = sg.build_groups_from_pools(names,pools_object)
+    seconds = time.perf_counter()-start
+
+    sizes = np.bincount([len(group) for group in groups]) if groups else np.zeros(1,dtype=int)
+    orphans = sum(1 for member in range(1,len(names)+1) if member!=null_position and pools_object.is_orphan(member))
+    return {"iteration": iteration, "no_of_preferences": no_of_preferences, "max_set_size": max_set_size,
+            "groups": len(groups), "largest": len(sizes)-1, "orphans": orphans, "seconds": round(seconds,4),
+            "sizes": " ".join("{}:{}".format(size,int(sizes[size])) for size in range(1,len(sizes)) if sizes[size])}
+
+def sweep(input_file,iterations,preferences_counts,max_set_sizes,workers=None):
+    """
+    Read and encode the preferences once, then run every combination of the parameters in a pool of worker processes and return the summaries
+    """
+    preferences,names = sg.read_preferences(input_file,max(preferences_counts))
+    memory = shared_memory.SharedMemory(create=True,size=max(preferences.nbytes,1))
+    try:
+        np.ndarray(shape=preferences.shape,dtype=np.int32,buffer=memory.buf)[:] = preferences
+        combinations = list(itertools.product(iterations,preferences_counts,max_set_sizes))
+        with ProcessPoolExecutor(max_workers=workers,initializer=attach_preferences,initargs=(memory.name,preferences.shape,names)) as executor:
+            futures = [executor.submit(run_combination,*combination) for combination in combinations]
+            return [future.result() for future in futures]
+    finally:
+        memory.close()
+        memory.unlink()
+
+def write_summary(summaries,output_file):
+    """
+    Write one row per combination to a csv file
+    """
+    with open(output_file,"w",newline="") as csvfile:
+        writer = csv.DictWriter(csvfile,fieldnames=list(summaries[0].keys()))
+        writer.writeheader()
+        writer.writerows(summaries)
+
+def main():
+    try:
+        input_file = sys.argv[1]
+        iterations = [int(value) for value in sys.argv[2].split(",")]
+        preferences_counts = [int(value) for value in sys.argv[3].split(",")]
+        max_set_sizes = [int(value) for value in sys.argv[4].split(",")]
+        workers = int(sys.argv[5]) if len(sys.argv)>5 else None
+    except (IndexError, ValueError):
+        print("stableGroupsSweep.py [input_file] [iterations] [no_of_preferences] [max_set_sizes] [workers]\n")
+        print("each of iterations, no_of_preferences and max_set_sizes is a comma separated list, e.g. 1,2,3\n")
+        sys.exit()
+
+    summaries = sweep(input_file,iterations,preferences_counts,max_set_sizes,workers)
+    for summary in summaries:
+        print("iteration {iteration} preferences {no_of_preferences} max set size {max_set_size}: {groups} groups (largest {largest}), {orphans} orphans, {seconds}s, sizes {sizes}".format(**summary))
+    write_summary(summaries,"sweep.csv")
+    print("\n Summary written to sweep.csv")
+
+if __name__ == "__main__":
+    main()
@@ -1,451 +1,1763 @@
-"""
-#
-#  Author : James Hope          
-#  Date   : 13 May 2018          
-#
-"""
-
-import sys
-import csv
-import numpy as np
-import pandas as pd
-import sets
-import copy
-
-# parse command line options    
-debug = False
-
-# Pool Class :: holds engagements
-class Pool:
-    def __init__(self, acceptors):
-        """
-        Construct an array which will hold the engagements. Instatiate each maximum preference number that 
-        """
-        self.engagements = np.empty(shape=len(acceptors))
-        self.engagements.fill(np.nan) 
-
-    def new_engagement(self,acceptor,proposer):
-        """
-        Update (replace) the engagement in the pool 
-        """
-        #print("entering new engagement")
-        if proposer in self.engagements:
-            #print("new engagement1")
-            self.engagements[self.engagements.tolist().index(proposer)] = np.nan
-
-        if acceptor in self.engagements:
-            #print("new engagement2")
-            self.engagements[self.engagements.tolist().index(acceptor)] = np.nan
-
-        self.engagements[acceptor-1] = proposer
-        self.engagements[proposer-1] = acceptor
-        #print("new engagement made")
-
-    def is_complete(self):
-        """
-        Return True if complete
-        """
-        if (np.isnan(self.engagements).any()):
-            return False
-        else:
-            return True
-
-    def not_engaged(self,proposer):
-        """
-        Return True if engaged otherwise False
-        """
-        if proposer in self.engagements:
-            return False
-        else:
-            return True
-
-    def get_current_engagement(self,acceptor): 
-        """
-        Return the current engagement for a acceptor
-        """
-        return self.engagements[acceptor-1]
-
-    def get_all_engagements(self):
-        """
-        Return all the current engagements
-        """        
-        return self.engagements
-
-# Acceptor Class :: holds the acceptor preferences
-class Acceptor:
-    def __init__(self,values):
-        """
-        Construct the acceptor preferences
-        """
-        self.values = values
-
-    def get_preference_number(self,acceptor,proposer,null_position):
-        """
-        Return the preference of the acceptor for the proposer passed. Return 0 if value is null or if the preference is not in the list.
-        """
-        #if (proposer==null_position) or (acceptor==null_position): 
-        #    return 0
-
-        if proposer in self.values[acceptor-1]:
-            return self.values[acceptor-1].index(proposer)+1
-        else: 
-            return 0
-
-    def is_proposal_accepted(self,acceptor,proposer,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object):
-        """
-        If proposer is in accepter preferences return true else return false
-        """
-        if debug: print("position of preference in acceptor table (for proposal):", self.get_preference_number(acceptor,proposer))
-        if debug: print("acceptor is currently engaged to:", pool_object.get_current_engagement(acceptor))
-        if debug: print("position of preference in acceptor table (for current engagement):", self.get_preference_number(acceptor,pool_object.get_current_engagement(acceptor)))
-
-        #check if the proposal would create a set size that exceeds the maximum set size and if so return false
-        if is_set_size_allowed(acceptors_table,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size)==False:
-            return False
-
-        if orphan_round: 
-            # If Orphan then If Engagements empty accept, Elseif better than current engagement accept; Else reject (i.e. not listed)
-            if (np.isnan(pool_object.get_current_engagement(acceptor)) and np.isnan(pool_object.get_current_engagement(proposer)) and pools_object.is_orphan(proposer) and pools_object.is_valid_engagement(acceptor,proposer) and (self.get_preference_number(acceptor,proposer,null_position)!=0)):
-                return True
-            elif ((pools_object.is_orphan(proposer) and pools_object.is_valid_engagement(acceptor,proposer) and (self.get_preference_number(acceptor,proposer,null_position)!=0) and (self.get_preference_number(acceptor,proposer,null_position) < self.get_preference_number(acceptor,pool_object.get_current_engagement(acceptor),null_position)))): 
-                return True 
-            else:
-                return False
-        else:
-            # Same logic as above but do not restrict to orphans
-            if (np.isnan(pool_object.get_current_engagement(acceptor)) and np.isnan(pool_object.get_current_engagement(proposer)) and (self.get_preference_number(acceptor,proposer,null_position)!=0) and pools_object.is_valid_engagement(acceptor,proposer)):
-                return True
-            elif ((pools_object.is_valid_engagement(acceptor,proposer) and (self.get_preference_number(acceptor,proposer,null_position)!=0) and (self.get_preference_number(acceptor,proposer,null_position) < self.get_preference_number(acceptor,pool_object.get_current_engagement(acceptor),null_position)))): 
-                return True 
-            else:
-                return False
-
-# Proposer Class :: holds the proposer preferences
-class Proposer:
-    def __init__(self, values):
-        """
-        Construct the proposer preferences
-        """
-        self.values = values
-
-    def get_proposal(self,proposer,iteration):
-        """
-        Return the acceptor value (proposal to try) for the proposer and iteration passed
-        """
-        #print("proposer",proposer,"iteration",iteration,"result",self.values[proposer][iteration])
-        return self.values[proposer][iteration]
-
-# Pools Class :: holds pool (engagement) objects  
-class Pools:
-    def __init__(self):
-        """
-        Construct the proposer preferences
-        """
-        self.values = []
-
-    def length(self):
-        """
-        Return the length of the pools set
-        """
-        return len(self.values)
-
-    def add_pool(self,pool_object):
-        """
-        Add pool objects to the Pools object class
-        """
-        self.values.append(pool_object)
-        
-    def remove_pool(self):
-        """
-        Remove last object added to values
-        """
-        self.values.pop(len(self.values)-1)
-
-    def is_valid_engagement(self,acceptor,proposer):
-        """
-        If already engaged to proposer in previous iteration; otherwise return True
-        """
-        for i in range(len(self.values)):   
-            if self.values[i].get_current_engagement(acceptor)==proposer: 
-                return False #if found don't allow engagement
-        
-        return True 
-        
-    def is_orphan(self,proposer):
-        """
-        Check if the proposer appears on any previous set of engagements (pool) and if so return True to indicate orphan
-        """
-        for i in range(len(self.values)):   
-            if not np.isnan(self.values[i].get_current_engagement(proposer)): 
-                return False  #if found don't allow engagement
-        return True 
-
-    def get_pool_object(self,pool_object_number):
-        """
-        Return the pool object from the pools class
-        """
-        return self.values[pool_object_number]
-
-def import_preferences(input_file):
-    """
-        Read the data from file and return the names and preferences
-    """
-    with open(input_file) as csvfile:
-        preferences = []
-        names = []
-        reader = csv.reader(csvfile)
-        print("\n Input file read from file \n")
-        for row in reader:
-            data = list(row)
-            print("{}".format(data))
-            preferences.append(data[1:])    
-            names.append(data[0])
-        return(preferences[1:], names[1:])
-
-def encode(names,name):
-    """
-    Return the index of the name in the list of names
-    """
-    return names.index(name)+1
-
-def return_null_position(names):
-    """
-    Return tye position of the null value
-    """
-    return names.index("null")+1
-
-def is_set_size_allowed(acceptors_table,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size):
-    """
-    If engagement creates a set size that exeeds max_set_size return False; otherwise return True 
-    """
-    # create dummy pool and pools
-    pool_test = Pool(acceptors_table)
-    pool_test = copy.deepcopy(pool_object)     
-    pool_test.new_engagement(proposer_object.get_proposal(proposer,preference),proposer+1)
-    
-    pools_test = Pools()
-    pools_test = copy.deepcopy(pools_object)  
-    pools_test.add_pool(pool_test)
-    
-    if (len(build_groups(names,build_pairs(names,pools_test),pools_test))>max_set_size):        
-        #print(build_groups(names,build_pairs(names,pools_object),pools_object))        
-        return False
-        
-    del pool_test
-    del pools_test
-        
-    return True
-
-def encode_preferences(preferences,names,no_of_preferences):
-    """
-    Encode the preferences 
-    """
-    df = pd.DataFrame(data=preferences)
-    
-    for i in range(0,no_of_preferences):
-        df[i] = df[i].apply(lambda x: encode(names,x))
-
-    return(df.values.tolist())
-
-def dec(names,index):
-    """
-    Return the index of the name in the list of names
-    """
-    return names[index-1]
-
-def decode(pairs,names):
-    """
-    Decode the engagements
-    """  
-    df = pd.DataFrame(data=pairs)
-    df[0] = df[0].fillna(-2)  
-    df = pd.DataFrame(data=pairs).astype(int)    
-    df[0] = df[0].apply(lambda x: dec(names,x) if x>0 else None) #decode engagements (ignore negative values)
-    return(df.values.tolist())
-
-def stable_pairs(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,orphan_round,max_set_size,names):
-    """
-    Create stable engagements and return the list
-    """
-    for preference in range(0,no_of_preferences):
-        if debug: print("/n PREFERENCE:", preference+1)
-        #print("width",range(len(proposers_table[preference])))
-        for proposer in range(len(proposers_table)-1):
-
-            if pool_object.not_engaged(proposer+1):
-                if debug: print("PROPOSAL:", proposer+1, "---->", proposers_table[proposer][preference])        
-                
-                if accepter_object.is_proposal_accepted(proposer_object.get_proposal(proposer,preference),proposer+1,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object): #if proposal is accepter
-                    if debug: print("PROPOSAL ACCEPTED")
-                    pool_object.new_engagement(proposer_object.get_proposal(proposer,preference),proposer+1)
-                else:
-                    if debug: print("PROPOSAL FAILED")
-
-                #print(pool_object.get_all_engagements())
-
-            if pool_object.is_complete():
-                return pool_object
-
-    return pool_object
-
-def stable_marriage(pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,iteration,no_of_preferences,null_position,max_set_size,names):
-    """
-    Call the stable_pairs function iteratively and update the Pools object
-    """
-    for i in range(iteration):
-        if debug: print("ITERATION:",i+1)
-        
-        # add pool object with stable pairs
-        pool_object = Pool(acceptors_table) #create a pool object
-        pools_object.add_pool(stable_pairs(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,False,max_set_size,names)) #call stable pairs
-        print("\n Engagements (all members) found at iteration {} \n {}".format(i+1,pool_object.get_all_engagements()))
-        
-        # add pool object with orphans
-        pool_object = Pool(acceptors_table) #create a pool object
-        pools_object.add_pool(stable_pairs(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,True,max_set_size,names)) #call stable pairs
-        print("\n Engagements (Orpans) found at iteration {} \n {}".format(i+1,pool_object.get_all_engagements()))
-        
-def build_pairs(names,pools_object):
-    """
-    Build a list of all stable pairs by fetching pairs from each pool_object in the pools_object
-    """
-    pairs = pd.DataFrame()
-    pairs[0] = names
-
-    for i in range(pools_object.length()):
-        pairs[i+1] = np.array(decode(pools_object.get_pool_object(i).get_all_engagements(), names)).flatten() #pd.DataFrame(data=engagements)  
-
-    return(pairs)
-
-def check_if_intersection(set_1,set_2):
-    """
-    Returns true if an intersection between two lists is found, otherwise false
-    """
-    set1 = set(set_1)
-    set2 = set(set_2)
-
-    if ((set1.intersection(set2) != set()) and (not "null" in set1) and(not "null" in set2)):
-        return True
-    else:
-        return False
-
-def get_union(set_1,set_2):
-    """
-    Returns the union of two lists
-    """
-    set1 = set(set_1)
-    set2 = set(set_2)
-    result = set1.union(set2)
-    
-    if "null" in result:
-        result.remove("null")
-    return result
-
-def build_groups(names,pairs,pools_object):
-    """
-    From the pairs data, build lists of sets and return the set lists (provided there are more than 2 columns)
-    """
-    sets = []
-    pairs = pairs.fillna(value="null")
-    
-    #only perform traverse if we have a minimum of two columns
-    if pairs.shape[1]>1:
-        
-        #create sets for members at first level
-        for i in range(len(names)):
-            result = list(get_union(list([pairs[0][i]]),list([pairs[1][i]])))
-            if result not in sets:
-                sets.append(result)
-        #print("output of level1 join", sets)
-    
-        # Now join level2, level3 etc members and maintain the trees
-        for i in range(2,pools_object.length()+1): #or   #pairs.shape[1]
-            for j in range(len(names)):
-                index_to_join = -1
-                index_to_remove = -1
-    
-                #check if the student is already in a set somewhere else and if so get the index of that set
-                for k in range(len(sets)):
-                    if pairs[i][j] in sets[k]:
-                        index_to_remove = k
-                        if debug: print("index to remove", index_to_remove)
-    
-                #get the index of the set the student is already in 
-                for k in range(len(sets)):
-                    if pairs[0][j] in sets[k]:
-                        index_to_join = k
-                        if debug: print("index to join",index_to_join)
-    
-                if (index_to_join==index_to_remove):
-                    #print("idex to join = index to remove")
-                    pass
-                elif ((index_to_remove!=-1) and (index_to_join!=-1)):
-                    sets[index_to_join] = list(get_union(sets[index_to_join],sets[index_to_remove]))
-                    sets.pop(index_to_remove) 
-    
-    df = pd.DataFrame(data=sets)
-    df = df.transpose()
-    return df 
-
-def main():
-
-    try:
-        input_file = "Preferences4.csv"
-        #input_file = sys.argv[1]
-        iteration = 2
-        #iteration = int(sys.argv[2]) # Number of runs of stable pairs algoirthm. Subsequent runs ignore stable pairs already built.
-        no_of_preferences = 5
-        #no_of_preferences = int(sys.argv[3]) # Number of preferences to read from input file
-        max_set_size = 12
-        #max_set_size = int(sys.argv[4]) # Maximum number in a set
-        
-    except: 
-        print("stableGroups.py --[input_file] --[iteration] --[no_of_preferences] --[max_set_size]\n")
-        print("--[input_file] \n input file in csv format \n")
-        print("--[iteration] \n number of runs of Stable Pairs Algorithm \n")
-        print("--[no_of_preferences] \n number of preferences to read from input file \n")
-        print("--[max_set_size] \n maximum size of a set \n")
-        sys.exit()
-    else: pass
-
-    output_file_stable_pairs = 'pools.csv'
-    output_file_sets = 'sets.csv'
-    
-    # Import and Encode the preferences data
-    preferences,names = import_preferences(input_file) 
-    preferences = encode_preferences(preferences,names,no_of_preferences)
-    print("\n Input file with {} preferences read and encoded successfully as \n {}".format(no_of_preferences, preferences))
-
-    null_position = return_null_position(names)
-    print("\n Instantiating Acceptor and Proposer objects with input preference data... \n")
-    acceptors_table = preferences
-    #acceptors_table = [[1,3,2,4],[3,4,1,2],[4,2,3,1],[3,2,1,4]]
-    proposers_table = acceptors_table
-
-    # Instantiate the Acceptor and Proposer class objects
-    accepter_object = Acceptor(acceptors_table)
-    proposer_object = Proposer(proposers_table)
-    print("\n Instantiating Pool and Pools objects ready to hold engagements... \n")
-
-    # Instantiate the Pools Class object
-    pools_object = Pools()
-
-    # Run the Algorithm
-    print("\n Finding Stable Pairs with {} iterations of the algorithm... \n".format(iteration))
-    stable_marriage(pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,iteration,no_of_preferences,null_position,max_set_size,names)
-
-    # Write the engagements to file
-    pairs = build_pairs(names,pools_object)
-    print("\n Writing pairs to file (1st iteration row 1 - 2, 2nd iteration 1 - 3 etc.)\n {}".format(pairs))
-    #print("\n Writing pairs to file (1st iteration row 1 - 2, 2nd iteration 1 - 3 etc.)\n")
-    pairs.to_csv(output_file_stable_pairs)
-
-    # Convert engagements to sets and write to file
-    groups = build_groups(names,pairs,pools_object)
-    print("\n Writing sets to file (a set is a column)\n {}".format(groups))
-    print("length of groups", len(groups))
-    groups.to_csv(output_file_sets)
-
-if __name__ == "__main__":
-    main()
-
+"""
+#
+#  Author : James Hope          
+#  Date   : 13 May 2018          
+#
+"""
+
+import sys
+import os
+import io
+import csv
+import time
+import heapq
+import functools
+import contextlib
+import collections
+import numpy as np
+#pandas is imported only where DataFrames are built (build_pairs, build_groups, run) to keep start up fast
+
+# parse command line options    
+debug = False
+stats = None #Stats object counting and timing the run, None when off
+
+# Stats Class :: counters and timings of a matching run
+class Stats:
+    def __init__(self):
+        """
+        Construct the counters (proposals, acceptances, rejections by reason, displacements) and the phase timings
+        """
+        self.counts = {"proposals": 0, "acceptances": 0, "rejections": 0, "displacements": 0}
+        self.rejections = {"set_size": 0, "not_orphan": 0, "already_paired": 0, "not_listed": 0, "worse_rank": 0}
+        self.timings = {}
+        self.calls = {}
+        self.profile_text = None
+
+    def count(self,name,number=1):
+        """
+        Add to the counter
+        """
+        self.counts[name] += number
+
+    def count_proposal(self,reason):
+        """
+        Count a proposal, accepted if reason is None otherwise rejected for the reason
+        """
+        self.counts["proposals"] += 1
+        if reason is None:
+            self.counts["acceptances"] += 1
+        else:
+            self.counts["rejections"] += 1
+            self.rejections[reason] += 1
+
+    def add_time(self,phase,seconds):
+        """
+        Add the time spent in the phase
+        """
+        self.timings[phase] = self.timings.get(phase,0.0)+seconds
+        self.calls[phase] = self.calls.get(phase,0)+1
+
+    def profile(self,function,*args,**kwargs):
+        """
+        Run the function under cProfile, keep the top entries for the report and return the result of the function
+        """
+        import cProfile
+        import pstats
+        self.profiler = cProfile.Profile()
+        result = self.profiler.runcall(function,*args,**kwargs)
+        text = io.StringIO()
+        pstats.Stats(self.profiler,stream=text).sort_stats("cumulative").print_stats(25)
+        self.profile_text = text.getvalue()
+        return result
+
+    def report(self):
+        """
+        Return the counters and timings as a dictionary
+        """
+        timings = {}
+        for phase in self.timings:
+            timings[phase] = {"seconds": self.timings[phase], "calls": self.calls[phase]}
+        return {"counts": self.counts, "rejections": self.rejections, "timings": timings, "profile": self.profile_text}
+
+    def dump(self,output_file):
+        """
+        Write the report to file as JSON
+        """
+        import json
+        with open(output_file,"w") as jsonfile:
+            json.dump(self.report(),jsonfile,indent=1)
+
+def start_stats():
+    """
+    Turn the counters and timings on and return the Stats object
+    """
+    global stats
+    stats = Stats()
+    return stats
+
+def stop_stats():
+    """
+    Turn the counters and timings off and return the Stats object
+    """
+    global stats
+    result = stats
+    stats = None
+    return result
+
+def timed(phase):
+    """
+    Decorator adding the time spent in the function to the phase when the stats are on
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args,**kwargs):
+            if stats is None:
+                return function(*args,**kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args,**kwargs)
+            finally:
+                stats.add_time(phase,time.perf_counter()-start)
+        return wrapper
+    return decorate
+
+# Pool Class :: holds engagements
+class Pool:
+    __slots__ = ("partners","unmatched","changes")
+
+    def __init__(self, acceptors):
+        """
+        Construct an array which will hold the engagements. Each member holds the number of its partner or -1 if not engaged
+        """
+        self.partners = np.full(shape=len(acceptors),fill_value=-1,dtype=np.int32)
+        self.unmatched = len(acceptors) #number of members not engaged
+        self.changes = [] #members engaged since the groups were last checked
+
+    def new_engagement(self,acceptor,proposer):
+        """
+        Update (replace) the engagement in the pool 
+        """
+        self.changes.extend((acceptor,proposer))
+
+        # release the current partners of the proposer and the acceptor
+        for member in (proposer,acceptor):
+            partner = self.partners[member-1]
+            if partner!=-1:
+                self.partners[partner-1] = -1
+                self.unmatched += 1
+                if (stats is not None) and (partner!=acceptor) and (partner!=proposer):
+                    stats.count("displacements")
+
+        for member,partner in ((acceptor,proposer),(proposer,acceptor)):
+            if self.partners[member-1]==-1:
+                self.unmatched -= 1
+            self.partners[member-1] = partner
+
+    def is_complete(self):
+        """
+        Return True if complete
+        """
+        return self.unmatched==0
+
+    def not_engaged(self,proposer):
+        """
+        Return True if not engaged otherwise False
+        """
+        return self.partners[proposer-1]==-1
+
+    def get_current_engagement(self,acceptor): 
+        """
+        Return the current engagement for a acceptor (-1 if not engaged)
+        """
+        return int(self.partners[acceptor-1])
+
+    def get_partners(self):
+        """
+        Return the array of partners (-1 if not engaged)
+        """
+        return self.partners
+
+    def get_all_engagements(self):
+        """
+        Return all the current engagements (NaN if not engaged)
+        """        
+        return np.where(self.partners==-1,np.nan,self.partners.astype(np.float64))
+
+# Preferences Class :: sparse (CSR) preference lists, memory grows with the number of preferences listed
+class Preferences:
+    def __init__(self,indptr,indices,fill):
+        """
+        Construct the preference lists from CSR arrays: member i (numbered from 1) lists indices[indptr[i-1]:indptr[i]] in order of preference.
+        Rows may have different lengths, a preference past the end of a row reads as fill (the null member)
+        """
+        self.indptr = np.asarray(indptr,dtype=np.int64)
+        self.indices = np.asarray(indices,dtype=np.int32)
+        self.fill = fill
+        self.stride = max(len(self.indptr),int(self.indices.max(initial=0))+1)
+
+        # sorted keys (member-1)*stride+listed with the preference number of the first listing, for rank lookups by binary search
+        rows = np.repeat(np.arange(len(self.indptr)-1,dtype=np.int64),np.diff(self.indptr))
+        positions = np.arange(len(self.indices),dtype=np.int64)-self.indptr[:-1][rows]
+        listed = self.indices>0
+        keys = rows[listed]*self.stride+self.indices[listed]
+        positions = positions[listed]
+        order = np.lexsort((positions,keys))
+        keys = keys[order]
+        first = np.ones(shape=len(keys),dtype=bool)
+        first[1:] = keys[1:]!=keys[:-1]
+        self.keys = keys[first]
+        self.ranks = (positions[order][first]+1).astype(np.min_scalar_type(int(np.diff(self.indptr).max(initial=0))))
+
+    def __len__(self):
+        """
+        Return the number of members
+        """
+        return len(self.indptr)-1
+
+    def get(self,member,position):
+        """
+        Return the member listed at the position (both numbered from 0) of the row of the member
+        """
+        index = self.indptr[member]+position
+        if index<self.indptr[member+1]:
+            return int(self.indices[index])
+        return self.fill
+
+    def get_rank(self,member,listed):
+        """
+        Return the preference number of the member (numbered from 1) for the listed member, 0 if not listed
+        """
+        if not (0<listed<self.stride):
+            return 0
+        key = (member-1)*self.stride+listed
+        position = int(self.keys.searchsorted(key))
+        if (position<len(self.keys)) and (self.keys[position]==key):
+            return int(self.ranks[position])
+        return 0
+
+    def get_ranks(self,members,listed):
+        """
+        Return the preference numbers for many member and listed member pairs at once, 0 where not listed
+        """
+        members = np.asarray(members,dtype=np.int64)
+        listed = np.asarray(listed,dtype=np.int64)
+        keys = (members-1)*self.stride+listed
+        positions = np.minimum(self.keys.searchsorted(keys),max(len(self.keys)-1,0))
+        found = (listed>0) & (listed<self.stride) & (len(self.keys)>0)
+        found[found] = self.keys[positions[found]]==keys[found]
+        result = np.zeros(shape=len(members),dtype=self.ranks.dtype)
+        result[found] = self.ranks[positions[found]]
+        return result
+
+    def to_table(self,no_of_preferences):
+        """
+        Return the preferences as a matrix with a row per member and no_of_preferences columns, padded with fill
+        """
+        lengths = np.minimum(np.diff(self.indptr),no_of_preferences)
+        table = np.full(shape=(len(self),no_of_preferences),fill_value=self.fill,dtype=np.int32)
+        rows = np.repeat(np.arange(len(self)),lengths)
+        columns = np.arange(len(rows))-np.repeat(np.cumsum(lengths)-lengths,lengths)
+        table[rows,columns] = self.indices[self.indptr[:-1][rows]+columns]
+        return table
+
+# Acceptor Class :: holds the acceptor preferences
+class Acceptor:
+    def __init__(self,values):
+        """
+        Construct the acceptor preferences and the table of preference numbers (looked up in the Preferences passed instead if sparse)
+        """
+        self.values = values
+        self.sparse = isinstance(values,Preferences)
+        self.ranks = None if self.sparse else self.build_ranks(values)
+
+    def build_ranks(self,values):
+        """
+        Return a table with a row per acceptor and a column per proposer holding the preference number of the proposer (first listing wins), 0 if not listed
+        """
+        if isinstance(values,np.ndarray):
+            width = max(len(values),int(values.max(initial=0)))
+            ranks = np.zeros(shape=(len(values),width+1),dtype=np.min_scalar_type(values.shape[1]))
+            rows = np.arange(len(values))
+            for position in reversed(range(values.shape[1])):
+                listed = values[:,position]>0
+                ranks[rows[listed],values[listed,position]] = position+1
+            return ranks
+
+        width = len(values)
+        longest = 0
+        for acceptor in range(len(values)):
+            longest = max(longest,len(values[acceptor]))
+            for proposer in values[acceptor]:
+                if isinstance(proposer,(int,np.integer)):
+                    width = max(width,int(proposer))
+
+        ranks = np.zeros(shape=(len(values),width+1),dtype=np.min_scalar_type(longest))
+        for acceptor in range(len(values)):
+            for position in reversed(range(len(values[acceptor]))):
+                proposer = values[acceptor][position]
+                if isinstance(proposer,(int,np.integer)) and proposer>0:
+                    ranks[acceptor,proposer] = position+1
+        return ranks
+
+    def get_preference_number(self,acceptor,proposer,null_position):
+        """
+        Return the preference of the acceptor for the proposer passed. Return 0 if value is null or if the preference is not in the list.
+        """
+        #if (proposer==null_position) or (acceptor==null_position): 
+        #    return 0
+
+        if self.sparse:
+            return 0 if np.isnan(proposer) else self.values.get_rank(acceptor,int(proposer))
+        if np.isnan(proposer) or not (0<proposer<self.ranks.shape[1]):
+            return 0
+        return int(self.ranks[acceptor-1,int(proposer)])
+
+    def get_preference_numbers(self,acceptors,proposers):
+        """
+        Return the preferences for many acceptor and proposer pairs at once. Return 0 where the proposer is null or not in the list.
+        """
+        acceptors = np.asarray(acceptors,dtype=np.int64)
+        proposers = np.asarray(proposers,dtype=np.float64)
+        if self.sparse:
+            return self.values.get_ranks(acceptors,np.nan_to_num(proposers,nan=0).astype(np.int64))
+        listed = (~np.isnan(proposers)) & (proposers>0) & (proposers<self.ranks.shape[1])
+        result = np.zeros(shape=len(acceptors),dtype=self.ranks.dtype)
+        result[listed] = self.ranks[acceptors[listed]-1,proposers[listed].astype(np.int64)]
+        return result
+
+    def is_proposal_accepted(self,acceptor,proposer,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object):
+        """
+        If proposer is in accepter preferences return true else return false
+        """
+        if debug: print("position of preference in acceptor table (for proposal):", self.get_preference_number(acceptor,proposer,null_position))
+        if debug: print("acceptor is currently engaged to:", pool_object.get_current_engagement(acceptor))
+        if debug: print("position of preference in acceptor table (for current engagement):", self.get_preference_number(acceptor,pool_object.get_current_engagement(acceptor),null_position))
+
+        if stats is not None:
+            return self.is_proposal_accepted_counted(acceptor,proposer,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object)
+
+        #check if the proposal would create a set size that exceeds the maximum set size and if so return false
+        if is_set_size_allowed(acceptors_table,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size)==False:
+            return False
+
+        return self.is_preferred(acceptor,proposer,pool_object,pools_object,null_position,orphan_round)
+
+    def is_preferred(self,acceptor,proposer,pool_object,pools_object,null_position,orphan_round):
+        """
+        Return True if the acceptor lists the proposer, the pair is new and the proposer is preferred to the current engagement
+        """
+        if orphan_round: 
+            # If Orphan then If Engagements empty accept, Elseif better than current engagement accept; Else reject (i.e. not listed)
+            if ((pool_object.get_current_engagement(acceptor)==-1) and (pool_object.get_current_engagement(proposer)==-1) and pools_object.is_orphan(proposer) and pools_object.is_valid_engagement(acceptor,proposer) and (self.get_preference_number(acceptor,proposer,null_position)!=0)):
+                return True
+            elif ((pools_object.is_orphan(proposer) and pools_object.is_valid_engagement(acceptor,proposer) and (self.get_preference_number(acceptor,proposer,null_position)!=0) and (self.get_preference_number(acceptor,proposer,null_position) < self.get_preference_number(acceptor,pool_object.get_current_engagement(acceptor),null_position)))): 
+                return True 
+            else:
+                return False
+        else:
+            # Same logic as above but do not restrict to orphans
+            if ((pool_object.get_current_engagement(acceptor)==-1) and (pool_object.get_current_engagement(proposer)==-1) and (self.get_preference_number(acceptor,proposer,null_position)!=0) and pools_object.is_valid_engagement(acceptor,proposer)):
+                return True
+            elif ((pools_object.is_valid_engagement(acceptor,proposer) and (self.get_preference_number(acceptor,proposer,null_position)!=0) and (self.get_preference_number(acceptor,proposer,null_position) < self.get_preference_number(acceptor,pool_object.get_current_engagement(acceptor),null_position)))): 
+                return True 
+            else:
+                return False
+
+    def is_proposal_accepted_counted(self,acceptor,proposer,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object):
+        """
+        Same as is_proposal_accepted, also timing the check and counting the proposal with the reason for a rejection
+        """
+        start = time.perf_counter()
+        if is_set_size_allowed(acceptors_table,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size)==False:
+            reason = "set_size"
+        elif self.is_preferred(acceptor,proposer,pool_object,pools_object,null_position,orphan_round):
+            reason = None
+        else:
+            reason = ""
+        stats.add_time("proposal_checks",time.perf_counter()-start)
+
+        # find the first condition that fails
+        if reason=="":
+            if orphan_round and not pools_object.is_orphan(proposer):
+                reason = "not_orphan"
+            elif not pools_object.is_valid_engagement(acceptor,proposer):
+                reason = "already_paired"
+            elif self.get_preference_number(acceptor,proposer,null_position)==0:
+                reason = "not_listed"
+            else:
+                reason = "worse_rank"
+        stats.count_proposal(reason)
+        return reason is None
+
+# Proposer Class :: holds the proposer preferences
+class Proposer:
+    def __init__(self, values):
+        """
+        Construct the proposer preferences (a table or Preferences)
+        """
+        self.values = values
+        self.sparse = isinstance(values,Preferences)
+
+    def get_proposal(self,proposer,iteration):
+        """
+        Return the acceptor value (proposal to try) for the proposer and iteration passed
+        """
+        #print("proposer",proposer,"iteration",iteration,"result",self.values[proposer][iteration])
+        if self.sparse:
+            return self.values.get(proposer,iteration)
+        return int(self.values[proposer][iteration])
+
+# Groups Class :: disjoint-set of the members joined by the engagements in the pools
+class Groups:
+    def __init__(self, size, null_position):
+        """
+        Construct a disjoint-set with one group per member. Members are numbered from 1 and the null member is never joined to a group 
+        """
+        self.null_position = null_position
+        self.parent = list(range(size+1))
+        self.size = [1]*(size+1)
+        self.next = list(range(size+1)) #circular list of the members of each group
+        self.unions = [] #stack of unions so that pools can be removed again
+        self.marks = [] #length of the union stack when each pool was added
+        self.pool = None #pool in progress that the oversized groups were found for
+        self.limit = None
+        self.oversized = [] #one member of each group larger than limit once the pool in progress is included
+
+    def find(self,member):
+        """
+        Return the root member of the group holding the member (no path compression so that unions can be undone)
+        """
+        while self.parent[member]!=member:
+            member = self.parent[member]
+        return member
+
+    def union(self,member_1,member_2):
+        """
+        Join the groups of the two members, smaller group under the larger, and record the union on the stack
+        """
+        root_1 = self.find(member_1)
+        root_2 = self.find(member_2)
+        if root_1==root_2:
+            return
+        if self.size[root_1]<self.size[root_2]:
+            root_1,root_2 = root_2,root_1
+        self.parent[root_2] = root_1
+        self.size[root_1] += self.size[root_2]
+        self.next[root_1],self.next[root_2] = self.next[root_2],self.next[root_1]
+        self.unions.append((root_1,root_2))
+
+    def add_pool(self,pool_object):
+        """
+        Join the groups of every engaged pair in the pool
+        """
+        self.marks.append(len(self.unions))
+        self.pool = None
+        partners = pool_object.get_partners().tolist()
+        for member in range(1,len(partners)+1):
+            partner = partners[member-1]
+            if (partner!=-1) and (member!=self.null_position) and (partner!=self.null_position):
+                self.union(member,partner)
+
+    def remove_pool(self):
+        """
+        Undo the unions made by the last pool added
+        """
+        mark = self.marks.pop()
+        self.pool = None
+        while len(self.unions)>mark:
+            root_1,root_2 = self.unions.pop()
+            self.parent[root_2] = root_2
+            self.size[root_1] -= self.size[root_2]
+            self.next[root_1],self.next[root_2] = self.next[root_2],self.next[root_1]
+
+    def group_size(self,member,partner,limit,seen=None):
+        """
+        Return the size of the group holding the member, where partner(member) gives the pairs of the pool in progress. Stop counting once the size exceeds limit
+        """
+        root = self.find(member)
+        if seen is None:
+            seen = set()
+        seen.add(root)
+        stack = [root]
+        total = 0
+        while stack:
+            root = stack.pop()
+            total += self.size[root]
+            if total>limit:
+                return total
+            current = root
+            while True:
+                engaged_to = partner(current)
+                if (engaged_to is not None) and (engaged_to!=self.null_position):
+                    engaged_root = self.find(engaged_to)
+                    if engaged_root not in seen:
+                        seen.add(engaged_root)
+                        stack.append(engaged_root)
+                current = self.next[current]
+                if current==root:
+                    break
+        return total
+
+    def find_oversized(self,members,partner,limit):
+        """
+        Return one member of each group larger than limit among the groups holding the members
+        """
+        seen = set()
+        oversized = []
+        for member in members:
+            if (member!=self.null_position) and (self.find(member) not in seen):
+                if self.group_size(member,partner,len(self.parent),seen)>limit:
+                    oversized.append(member)
+        return oversized
+
+    def is_engagement_allowed(self,pool_object,acceptor,proposer,max_set_size):
+        """
+        Return True if no group exceeds max_set_size once the proposer is engaged to the acceptor in the pool (releasing their current partners)
+        """
+        partners = pool_object.get_partners()
+
+        def current_partner(member):
+            engaged_to = int(partners[member-1])
+            if engaged_to==-1:
+                return None
+            return engaged_to
+
+        def partner(member):
+            if member==acceptor:
+                return proposer
+            if member==proposer:
+                return acceptor
+            engaged_to = current_partner(member)
+            if (engaged_to==acceptor) or (engaged_to==proposer):
+                return None
+            return engaged_to
+
+        # keep track of the groups that are already too large with the pool in progress
+        if (pool_object is not self.pool) or (max_set_size!=self.limit):
+            self.pool = pool_object
+            self.limit = max_set_size
+            del pool_object.changes[:]
+            self.oversized = self.find_oversized(range(1,len(self.parent)),current_partner,max_set_size)
+        elif pool_object.changes:
+            members = self.oversized+pool_object.changes
+            del pool_object.changes[:]
+            self.oversized = self.find_oversized(members,current_partner,max_set_size)
+
+        # only the groups of the engaged and released members change, the other groups must already be within the limit
+        for member in [acceptor,proposer,current_partner(acceptor),current_partner(proposer)]+self.oversized:
+            if (member is not None) and (member!=self.null_position):
+                if self.group_size(member,partner,max_set_size)>max_set_size:
+                    return False
+        return True
+
+# Pools Class :: holds pool (engagement) objects  
+class Pools:
+    def __init__(self):
+        """
+        Construct the proposer preferences
+        """
+        self.values = []
+        self.groups = None
+        self.paired = None #set of (acceptor-1)*size+proposer-1 for each pair engaged in any pool, grows with the engagements
+        self.size = 0
+        self.engaged = None #True for each member engaged in any pool
+        self.history = [] #pairs and members first added by each pool so that pools can be removed again
+
+    def length(self):
+        """
+        Return the length of the pools set
+        """
+        return len(self.values)
+
+    def add_pool(self,pool_object):
+        """
+        Add pool objects to the Pools object class
+        """
+        self.values.append(pool_object)
+        if self.groups is not None:
+            self.groups.add_pool(pool_object)
+
+        partners = pool_object.get_partners()
+        if self.paired is None:
+            self.paired = set()
+            self.size = len(partners)
+            self.engaged = np.zeros(shape=len(partners),dtype=bool)
+
+        # add the engaged pairs, remembering the ones that were not already there
+        members = np.flatnonzero(partners!=-1)
+        pairs = (members.astype(np.int64)*self.size+partners[members]-1).tolist()
+        new_pairs = [pair for pair in pairs if pair not in self.paired]
+        self.paired.update(new_pairs)
+        new_members = members[~self.engaged[members]]
+        self.engaged[members] = True
+        self.history.append((new_pairs,new_members))
+        
+    def remove_pool(self):
+        """
+        Remove last object added to values
+        """
+        self.values.pop(len(self.values)-1)
+        if self.groups is not None:
+            self.groups.remove_pool()
+
+        new_pairs,new_members = self.history.pop()
+        self.paired.difference_update(new_pairs)
+        self.engaged[new_members] = False
+
+    def track_groups(self,names,size):
+        """
+        Return the Groups object for the pools, building it from the pools added so far on first use
+        """
+        if self.groups is None:
+            self.groups = Groups(size,return_null_position(names))
+            for i in range(len(self.values)):
+                self.groups.add_pool(self.values[i])
+        return self.groups
+
+    def is_valid_engagement(self,acceptor,proposer):
+        """
+        If already engaged to proposer in previous iteration; otherwise return True
+        """
+        if self.paired is None:
+            return True
+        return ((acceptor-1)*self.size+proposer-1) not in self.paired
+        
+    def is_orphan(self,proposer):
+        """
+        Check if the proposer appears on any previous set of engagements (pool) and if so return True to indicate orphan
+        """
+        if self.engaged is None:
+            return True
+        return not self.engaged[proposer-1]
+
+    def get_paired_matrix(self):
+        """
+        Return the matrix of members engaged in any pool as a boolean array (row acceptor, column proposer)
+        """
+        if self.paired is None:
+            return np.zeros(shape=(0,0),dtype=bool)
+        matrix = np.zeros(shape=(self.size,self.size),dtype=bool)
+        pairs = np.fromiter(self.paired,dtype=np.int64,count=len(self.paired))
+        matrix[pairs//self.size,pairs%self.size] = True
+        return matrix
+
+    def get_pool_object(self,pool_object_number):
+        """
+        Return the pool object from the pools class
+        """
+        return self.values[pool_object_number]
+
+# ResultCache Class :: match results on disk, named by the hash of the preferences, names and parameters
+class ResultCache:
+    def __init__(self, directory, max_bytes=1<<30):
+        """
+        Construct the cache in the directory passed (created if missing), evicting the least recently used results above max_bytes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory,exist_ok=True)
+
+    def path(self,key):
+        """
+        Return the file holding the result for the key
+        """
+        return os.path.join(self.directory,key+".npz")
+
+    def get(self,key):
+        """
+        Return the Pools object and the group labels stored for the key, None if not cached. A hit marks the result as recently used
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as result:
+                partners = result["partners"]
+                labels = result["labels"]
+            os.utime(path)
+        except (OSError, KeyError, ValueError): #missing, evicted meanwhile or incomplete
+            return None
+
+        return build_pools(partners),labels
+
+    def put(self,key,pools_object,labels):
+        """
+        Store the engagements of every pool and the group labels for the key, then evict down to max_bytes. The file is written
+        under a temporary name and renamed, so other processes only ever see complete results
+        """
+        partners = stack_partners(pools_object,len(labels))
+        temporary_file = os.path.join(self.directory,"{}.{}.tmp".format(key,os.getpid()))
+        with open(temporary_file,"wb") as npzfile:
+            np.savez_compressed(npzfile,partners=partners,labels=labels)
+        os.replace(temporary_file,self.path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used results until the cache fits in max_bytes, one process at a time where file locks are available
+        """
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        with open(os.path.join(self.directory,".lock"),"a") as lockfile:
+            if fcntl is not None:
+                fcntl.flock(lockfile,fcntl.LOCK_EX)
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    try:
+                        status = os.stat(os.path.join(self.directory,name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((status.st_mtime,status.st_size,name))
+            total = sum(entry[1] for entry in entries)
+            for mtime,size,name in sorted(entries):
+                if total<=self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory,name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+def import_preferences(input_file):
+    """
+        Read the data from file and return the names and preferences
+    """
+    with open(input_file) as csvfile:
+        preferences = []
+        names = []
+        reader = csv.reader(csvfile)
+        print("\n Input file read from file \n")
+        for row in reader:
+            data = list(row)
+            print("{}".format(data))
+            preferences.append(data[1:])    
+            names.append(data[0])
+        return(preferences[1:], names[1:])
+
+def read_preferences(input_file,no_of_preferences,chunk_size=4096,echo=False):
+    """
+        Stream the data from file and return the preferences (encoded) and the names. The names are read first, then the
+        preferences are encoded chunk_size rows at a time into a preallocated matrix. Rows are printed only if echo is True
+    """
+    with open(input_file) as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader,None) #header
+        names = [row[0] for row in reader if len(row)>0]
+
+    name_index = build_name_index(names)
+    preferences = np.empty(shape=(len(names),no_of_preferences),dtype=np.int32)
+
+    with open(input_file) as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader,None) #header
+        chunk = []
+        start = 0
+        for line,row in enumerate(reader,2):
+            if len(row)==0:
+                continue
+            if echo: print("{}".format(row))
+            if len(row)<no_of_preferences+1:
+                raise ValueError("line {} of {} has {} preferences, expected at least {}".format(line,input_file,len(row)-1,no_of_preferences))
+            if not chunk:
+                first_line = line
+            chunk.append(row[1:no_of_preferences+1])
+            if len(chunk)==chunk_size:
+                preferences[start:start+len(chunk)] = encode_chunk(name_index,chunk,first_line)
+                start += len(chunk)
+                chunk = []
+        if chunk:
+            preferences[start:start+len(chunk)] = encode_chunk(name_index,chunk,first_line)
+
+    return(preferences, names)
+
+def encode_chunk(name_index,chunk,first_line):
+    """
+    Encode a chunk of preference rows, naming the first line of the chunk if a name is not in the index
+    """
+    try:
+        return encode_names(name_index,chunk)
+    except ValueError as error:
+        raise ValueError("{} (rows from line {})".format(error,first_line))
+
+def encode(names,name):
+    """
+    Return the index of the name in the list of names
+    """
+    return names.index(name)+1
+
+def return_null_position(names):
+    """
+    Return tye position of the null value
+    """
+    return names.index("null")+1
+
+@timed("group_checks")
+def is_set_size_allowed(acceptors_table,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size):
+    """
+    If engagement creates a set size that exeeds max_set_size return False; otherwise return True 
+    """
+    groups_object = pools_object.track_groups(names,len(acceptors_table))
+    return groups_object.is_engagement_allowed(pool_object,proposer_object.get_proposal(proposer,preference),proposer+1,max_set_size)
+
+def build_name_index(names):
+    """
+    Return the names in sorted order and the number of each sorted name (first occurrence wins) so that arrays of names can be encoded in one call
+    """
+    names_array = np.asarray(names,dtype=str)
+    order = np.argsort(names_array,kind="stable")
+    return names_array[order],(order+1).astype(np.int32)
+
+def encode_names(name_index,values):
+    """
+    Return the numbers of an array of names, raise ValueError if a name is not in the index
+    """
+    sorted_names,numbers = name_index
+    values = np.asarray(values,dtype=str)
+    positions = np.searchsorted(sorted_names,values)
+    positions[positions==len(sorted_names)] = 0
+    unknown = sorted_names[positions]!=values
+    if unknown.any():
+        raise ValueError("{} is not in list".format(values[unknown][0]))
+    return numbers[positions]
+
+def encode_preferences(preferences,names,no_of_preferences):
+    """
+    Encode the preferences as a matrix with a row per member and a column per preference
+    """
+    values = [row[:no_of_preferences] for row in preferences]
+    return np.ascontiguousarray(encode_names(build_name_index(names),values).reshape(len(preferences),no_of_preferences))
+
+def sparse_preferences(values,fill):
+    """
+    Return the encoded preferences (a matrix, or a list of rows of any length) as sparse Preferences, fill being the null position
+    """
+    if isinstance(values,np.ndarray):
+        indptr = np.arange(len(values)+1,dtype=np.int64)*values.shape[1]
+        return Preferences(indptr,values.reshape(-1),fill)
+    indptr = np.zeros(shape=len(values)+1,dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in values])
+    indices = np.fromiter((member for row in values for member in row),dtype=np.int32,count=int(indptr[-1]))
+    return Preferences(indptr,indices,fill)
+
+def read_sparse_preferences(input_file,no_of_preferences=None,echo=False):
+    """
+    Read the data from file and return the preferences as sparse Preferences and the names. Rows may list any number of
+    preferences (empty cells at the end of a row are ignored), only the first no_of_preferences are kept if given
+    """
+    names = []
+    lengths = []
+    listed = []
+    with open(input_file) as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader,None) #header
+        for row in reader:
+            if len(row)==0:
+                continue
+            if echo: print("{}".format(row))
+            names.append(row[0])
+            row = row[1:] if no_of_preferences is None else row[1:no_of_preferences+1]
+            while row and row[-1]=="":
+                row.pop()
+            lengths.append(len(row))
+            listed.extend(row)
+
+    indptr = np.zeros(shape=len(names)+1,dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+    indices = encode_names(build_name_index(names),listed) if listed else np.zeros(shape=0,dtype=np.int32)
+    return Preferences(indptr,indices,return_null_position(names)),names
+
+def dec(names,index):
+    """
+    Return the index of the name in the list of names
+    """
+    return names[index-1]
+
+def decode_names(names,numbers):
+    """
+    Return an array with the name of each number (None where the number is NaN or not positive)
+    """
+    numbers = np.asarray(numbers,dtype=np.float64)
+    valid = (~np.isnan(numbers)) & (numbers>0)
+    result = np.full(shape=numbers.shape,fill_value=None,dtype=object)
+    result[valid] = np.asarray(names,dtype=object)[numbers[valid].astype(np.intp)-1]
+    return result
+
+def decode(pairs,names):
+    """
+    Decode the engagements
+    """  
+    return(decode_names(names,pairs).reshape(-1,1).tolist()) #decode engagements (ignore negative values)
+
+def stable_pairs(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,orphan_round,max_set_size,names):
+    """
+    Create stable engagements and return the list
+    """
+    for preference in range(0,no_of_preferences):
+        if debug: print("/n PREFERENCE:", preference+1)
+        #print("width",range(len(proposers_table[preference])))
+        for proposer in range(len(proposers_table)-1):
+
+            if pool_object.not_engaged(proposer+1):
+                if debug: print("PROPOSAL:", proposer+1, "---->", proposer_object.get_proposal(proposer,preference))        
+                
+                if accepter_object.is_proposal_accepted(proposer_object.get_proposal(proposer,preference),proposer+1,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object): #if proposal is accepter
+                    if debug: print("PROPOSAL ACCEPTED")
+                    pool_object.new_engagement(proposer_object.get_proposal(proposer,preference),proposer+1)
+                else:
+                    if debug: print("PROPOSAL FAILED")
+
+                #print(pool_object.get_all_engagements())
+
+            if pool_object.is_complete():
+                return pool_object
+
+    return pool_object
+
+def stable_pairs_queue(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,orphan_round,max_set_size,names):
+    """
+    Create stable engagements and return the list. Free proposers wait in a queue in the order stable_pairs would visit them and only propose again after a rejection or when released, so the same proposals are made
+    """
+    proposers = len(proposers_table)-1
+    if proposers<=0:
+        return pool_object
+
+    next_choice = [0]*proposers #preference each proposer will propose with next (no_of_preferences if none)
+    queue = list(range(proposers)) #heap of preference*proposers+proposer
+
+    def schedule(proposer,preference):
+        if preference<next_choice[proposer]:
+            next_choice[proposer] = preference
+            heapq.heappush(queue,preference*proposers+proposer)
+
+    while queue:
+        preference,proposer = divmod(heapq.heappop(queue),proposers)
+        if preference>=no_of_preferences:
+            break
+        if next_choice[proposer]!=preference: #superseded by an earlier proposal
+            continue
+        next_choice[proposer] = no_of_preferences
+
+        if pool_object.not_engaged(proposer+1):
+            acceptor = proposer_object.get_proposal(proposer,preference)
+            if debug: print("PROPOSAL:", proposer+1, "---->", acceptor)
+            released = pool_object.get_current_engagement(acceptor)
+
+            if accepter_object.is_proposal_accepted(acceptor,proposer+1,pool_object,pools_object,null_position,orphan_round,max_set_size,names,preference,acceptors_table,proposer_object): #if proposal is accepter
+                if debug: print("PROPOSAL ACCEPTED")
+                pool_object.new_engagement(acceptor,proposer+1)
+                if pool_object.is_complete():
+                    return pool_object
+
+                # the released partner proposes again when next visited by stable_pairs
+                if (released!=-1) and (released-1<proposers) and pool_object.not_engaged(released):
+                    if released-1>proposer:
+                        schedule(released-1,preference)
+                    else:
+                        schedule(released-1,preference+1)
+            else:
+                if debug: print("PROPOSAL FAILED")
+                schedule(proposer,preference+1)
+
+    return pool_object
+
+# NoStableMatching Class :: raised by the stable roommates engine when the preferences admit no stable matching
+class NoStableMatching(ValueError):
+    pass
+
+def roommate_lists(pools_object,proposer_object,proposers_table,no_of_preferences,null_position,orphan_round):
+    """
+    Return the preference list of each member (numbered from 1) for the stable roommates problem: the members it lists (first listing,
+    leaving out itself, the null member and members it was paired with in earlier pools) that also list it. In the orphan round a
+    pair also needs one member not engaged in any earlier pool
+    """
+    members = [member for member in range(1,len(proposers_table)+1) if member!=null_position]
+    listed = {}
+    for member in members:
+        row = []
+        for preference in range(no_of_preferences):
+            other = int(proposer_object.get_proposal(member-1,preference))
+            if (other!=member) and (other!=null_position) and (0<other<=len(proposers_table)) and (other not in row) and pools_object.is_valid_engagement(member,other):
+                row.append(other)
+        listed[member] = row
+
+    lists = {}
+    for member in members:
+        lists[member] = [other for other in listed[member] if (member in listed[other]) and
+                         (not orphan_round or pools_object.is_orphan(member) or pools_object.is_orphan(other))]
+    return lists
+
+def stable_roommates(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,orphan_round,max_set_size,names):
+    """
+    Create stable engagements with Irving's algorithm for the stable roommates problem (incomplete lists) and return the pool. Members left
+    with an empty list after phase 1 stay unmatched, NoStableMatching is raised if phase 2 empties a list. The pairs of the stable matching
+    are then engaged in order of member number unless they would make a group larger than max_set_size
+    """
+    lists = roommate_lists(pools_object,proposer_object,proposers_table,no_of_preferences,null_position,orphan_round)
+    rank = {member: {other: position for position,other in enumerate(lists[member])} for member in lists}
+    alive = {member: set(lists[member]) for member in lists}
+    head = {member: 0 for member in lists} #first entry of each list that may still be alive
+    tail = {member: len(lists[member])-1 for member in lists} #last entry of each list that may still be alive
+
+    def reject(member,other):
+        alive[member].discard(other)
+        alive[other].discard(member)
+
+    def first(member):
+        while (head[member]<len(lists[member])) and (lists[member][head[member]] not in alive[member]):
+            head[member] += 1
+        return lists[member][head[member]] if head[member]<=tail[member] else None
+
+    def second(member):
+        position = head[member]+1
+        while (position<=tail[member]) and (lists[member][position] not in alive[member]):
+            position += 1
+        return lists[member][position] if position<=tail[member] else None
+
+    def last(member):
+        while (tail[member]>=0) and (lists[member][tail[member]] not in alive[member]):
+            tail[member] -= 1
+        return lists[member][tail[member]] if tail[member]>=head[member] else None
+
+    def truncate(member,other):
+        # the member rejects everyone it likes less than other, return the members rejected
+        rejected = [lists[member][position] for position in range(rank[member][other]+1,tail[member]+1) if lists[member][position] in alive[member]]
+        for current in rejected:
+            reject(member,current)
+        tail[member] = rank[member][other]
+        return rejected
+
+    # phase 1: each member proposes down its list, a member holding a proposal rejects everyone it likes less
+    proposed_to = {}
+    free = collections.deque(sorted(lists))
+    while free:
+        proposer = free.popleft()
+        acceptor = first(proposer)
+        if acceptor is None:
+            continue
+        proposed_to[proposer] = acceptor
+        for position in range(rank[acceptor][proposer]+1,tail[acceptor]+1):
+            rejected = lists[acceptor][position]
+            if rejected in alive[acceptor]:
+                reject(acceptor,rejected)
+                if proposed_to.get(rejected)==acceptor:
+                    del proposed_to[rejected]
+                    free.append(rejected)
+        tail[acceptor] = rank[acceptor][proposer]
+
+    # phase 2: eliminate rotations until every list holds at most one member
+    for member in sorted(lists):
+        while (first(member) is not None) and (second(member) is not None):
+            sequence = []
+            position = {}
+            current = member
+            while current not in position:
+                position[current] = len(sequence)
+                sequence.append(current)
+                current = last(second(current))
+            rotation = sequence[position[current]:]
+            seconds = [second(current) for current in rotation]
+            rejected = []
+            for current,other in zip(rotation,seconds):
+                rejected.extend(truncate(other,current))
+            for current in rejected:
+                if first(current) is None:
+                    raise NoStableMatching("no stable matching exists for pool {}: the list of member {} ({}) became empty while eliminating rotations".format(pools_object.length()+1,current,names[current-1]))
+
+    groups_object = pools_object.track_groups(names,len(acceptors_table))
+    for member in sorted(lists):
+        partner = first(member)
+        if (partner is not None) and (member<partner) and groups_object.is_engagement_allowed(pool_object,partner,member,max_set_size):
+            pool_object.new_engagement(partner,member)
+    return pool_object
+
+pair_engines = {"sweep": stable_pairs, "queue": stable_pairs_queue, "roommates": stable_roommates}
+
+def match_key(preferences,names,iteration,no_of_preferences,max_set_size):
+    """
+    Return the hash (hex) of the encoded preferences, the names and the parameters of a match
+    """
+    import hashlib
+    if isinstance(preferences,Preferences):
+        preferences = preferences.to_table(no_of_preferences)
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(preferences,dtype=np.int32).tobytes())
+    digest.update("\n".join(names).encode())
+    digest.update("{},{},{}".format(iteration,no_of_preferences,max_set_size).encode())
+    return digest.hexdigest()
+
+def save_checkpoint(checkpoint_file,pools_object,names,preferences,iteration,no_of_preferences,max_set_size):
+    """
+    Write the engagements of every pool with the encoded names, preferences and parameters to a compressed .npz file (replaced atomically)
+    """
+    partners = stack_partners(pools_object,len(names))
+    temporary_file = checkpoint_file+".tmp"
+    with open(temporary_file,"wb") as npzfile:
+        np.savez_compressed(npzfile,partners=partners,names=np.array(names,dtype=str),preferences=preferences.to_table(no_of_preferences) if isinstance(preferences,Preferences) else np.asarray(preferences,dtype=np.int32),
+                            parameters=np.array([iteration,no_of_preferences,max_set_size],dtype=np.int64))
+    os.replace(temporary_file,checkpoint_file)
+
+def load_checkpoint(checkpoint_file,names=None,preferences=None,no_of_preferences=None,max_set_size=None,iteration=None):
+    """
+    Return the Pools object and the number of iterations saved in a checkpoint, keeping at most iteration of them if passed (the first
+    iterations of a run are the same whatever the number run). Raise ValueError if the checkpoint was made with other names, preferences
+    or parameters than the ones passed
+    """
+    with np.load(checkpoint_file) as checkpoint:
+        partners = checkpoint["partners"]
+        saved_iteration,saved_no_of_preferences,saved_max_set_size = checkpoint["parameters"].tolist()
+        if (names is not None) and (checkpoint["names"].tolist()!=list(names)):
+            raise ValueError("checkpoint {} was made for other names".format(checkpoint_file))
+        if isinstance(preferences,Preferences):
+            preferences = preferences.to_table(saved_no_of_preferences)
+        if (preferences is not None) and not np.array_equal(checkpoint["preferences"],preferences):
+            raise ValueError("checkpoint {} was made for other preferences".format(checkpoint_file))
+    if (no_of_preferences not in (None,saved_no_of_preferences)) or (max_set_size not in (None,saved_max_set_size)):
+        raise ValueError("checkpoint {} was made with no_of_preferences {} and max_set_size {}".format(checkpoint_file,saved_no_of_preferences,saved_max_set_size))
+
+    if (iteration is None) or (iteration>saved_iteration):
+        iteration = saved_iteration
+    return build_pools(partners[:2*iteration]),iteration
+
+@timed("matching")
+def stable_marriage(pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,iteration,no_of_preferences,null_position,max_set_size,names,engine="sweep",checkpoint_file=None,echo=True):
+    """
+    Call the stable_pairs function (or the engine named, or a list naming the engine of each iteration) iteratively and update the Pools object.
+    Iterations already held by the Pools object (two pools each, e.g. loaded from a checkpoint) are not run again, and the Pools are saved to
+    checkpoint_file after each iteration. The engagements of each pool are printed if echo is True
+    """
+    engines = [engine]*iteration if isinstance(engine,str) else list(engine)
+
+    for i in range(pools_object.length()//2,iteration):
+        if debug: print("ITERATION:",i+1)
+        stable_pairs = pair_engines[engines[i]]
+        
+        # add pool object with stable pairs
+        pool_object = Pool(acceptors_table) #create a pool object
+        pools_object.add_pool(stable_pairs(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,False,max_set_size,names)) #call stable pairs
+        if echo: print("\n Engagements (all members) found at iteration {} \n {}".format(i+1,pool_object.get_all_engagements()))
+        
+        # add pool object with orphans
+        pool_object = Pool(acceptors_table) #create a pool object
+        pools_object.add_pool(stable_pairs(pool_object,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,no_of_preferences,null_position,True,max_set_size,names)) #call stable pairs
+        if echo: print("\n Engagements (Orpans) found at iteration {} \n {}".format(i+1,pool_object.get_all_engagements()))
+
+        if checkpoint_file:
+            save_checkpoint(checkpoint_file,pools_object,names,acceptors_table,i+1,no_of_preferences,max_set_size)
+
+def batch_group_labels(pools,null_position):
+    """
+    Label each member of each instance with the smallest member (numbered from 0) of its group through the engagements of the pools
+    (instances x pools x members) and return the labels with the size of each group at its smallest member (0 elsewhere and for the null member)
+    """
+    instances,size = pools.shape[0],pools.shape[2]
+    engaged_to = pools.reshape(instances,-1).astype(np.int64)
+    keep = (engaged_to!=-1) & (engaged_to!=null_position)
+    keep &= (np.arange(engaged_to.shape[1])%size)!=null_position-1
+    rows,positions = np.nonzero(keep)
+    labels = label_components(instances*size,rows*size+positions%size,rows*size+engaged_to[rows,positions]-1)
+    labels = labels.reshape(instances,size)-np.arange(instances)[:,None]*size
+    members = np.ones(shape=(instances,size),dtype=np.int64)
+    members[:,null_position-1] = 0
+    sizes = np.zeros(shape=instances*size,dtype=np.int64)
+    np.add.at(sizes,(labels+np.arange(instances)[:,None]*size).reshape(-1),members.reshape(-1))
+    return labels,sizes.reshape(instances,size)
+
+def batch_ranks(preferences,instances,acceptors,proposers):
+    """
+    Return the preference number of each acceptor for the proposer (one per instance passed), 0 if not listed
+    """
+    listed = preferences[instances,acceptors-1,:]==np.broadcast_to(proposers,len(instances))[:,None]
+    return np.where(listed.any(axis=1),listed.argmax(axis=1)+1,0)
+
+def batch_set_size_allowed(partners,instances,acceptors,proposers,labels,sizes,null_position,max_set_size):
+    """
+    For each instance passed, return True if no group exceeds max_set_size once the proposer is engaged to the acceptor (as Groups.is_engagement_allowed).
+    The groups of the earlier pools (labels, sizes) are joined by the engagements of the pool in progress and the trial engagement
+    """
+    count,size = len(instances),partners.shape[1]
+    rows = np.arange(count)
+    trial = partners[instances].astype(np.int64)
+
+    # release the partners of the acceptor and the proposer, then engage them
+    for members in (acceptors,proposers):
+        released = trial[rows,members-1]
+        has = released!=-1
+        trial[rows[has],released[has]-1] = -1
+    trial[rows,acceptors-1] = proposers
+    trial[rows,proposers-1] = acceptors
+
+    keep = (trial!=-1) & (trial!=null_position)
+    keep[:,null_position-1] = False
+    pair_rows,members = np.nonzero(keep)
+    base = labels[instances]
+    offsets = pair_rows*size
+    joined = label_components(count*size,offsets+base[pair_rows,members],offsets+base[pair_rows,trial[pair_rows,members]-1])
+    totals = np.bincount(joined,weights=sizes[instances].reshape(-1),minlength=count*size).reshape(count,size)
+    return totals.max(axis=1)<=max_set_size
+
+def stable_pairs_batch(partners,previous,engaged,preferences,no_of_preferences,null_position,orphan_round,max_set_size):
+    """
+    Run stable_pairs on every instance at once, filling partners (instances x members) with the engagements. previous holds the
+    pools already found (instances x pools x members) and engaged the members engaged in any of them. Every instance visits the
+    proposals in the order of stable_pairs and the decisions of a visit are taken together with array operations
+    """
+    instances,size = partners.shape
+    labels,sizes = batch_group_labels(previous,null_position)
+    active = np.ones(shape=instances,dtype=bool) #instances whose pool is not complete
+
+    for preference in range(no_of_preferences):
+        for proposer in range(size-1):
+            candidates = np.flatnonzero(active & (partners[:,proposer]==-1))
+            if len(candidates)==0:
+                continue
+            acceptors = preferences[candidates,proposer,preference].astype(np.int64)
+            current = partners[candidates,acceptors-1]
+            rank = batch_ranks(preferences,candidates,acceptors,proposer+1)
+            accepted = (rank!=0) & ((current==-1) | (rank<batch_ranks(preferences,candidates,acceptors,current)))
+            accepted &= ~(previous[candidates,:,acceptors-1]==proposer+1).any(axis=1)
+            if orphan_round:
+                accepted &= ~engaged[candidates,proposer]
+
+            # set size check of stable_pairs, made for the next member and its proposal
+            checked = np.flatnonzero(accepted)
+            if len(checked)>0:
+                trial_acceptors = preferences[candidates[checked],proposer+1,preference].astype(np.int64)
+                trial_proposers = np.full(shape=len(checked),fill_value=proposer+2,dtype=np.int64)
+                accepted[checked] = batch_set_size_allowed(partners,candidates[checked],trial_acceptors,trial_proposers,labels,sizes,null_position,max_set_size)
+
+            engaging = candidates[accepted]
+            if len(engaging)==0:
+                continue
+            acceptors = acceptors[accepted]
+            released = partners[engaging,acceptors-1]
+            has = released!=-1
+            partners[engaging[has],released[has]-1] = -1
+            partners[engaging,acceptors-1] = proposer+1
+            partners[engaging,proposer] = acceptors
+            active[engaging] = (partners[engaging]==-1).any(axis=1)
+    return partners
+
+def stable_marriage_batch(preferences,iteration,no_of_preferences,null_position,max_set_size):
+    """
+    Run stable_marriage on a stack of encoded preference matrices (instances x members x preferences, same null position) and
+    return the engagements of each pool of each instance (instances x pools x members, NaN if not engaged) as Pool.get_all_engagements
+    """
+    preferences = np.asarray(preferences,dtype=np.int32)
+    instances,size = preferences.shape[0],preferences.shape[1]
+    pools = np.full(shape=(instances,2*iteration,size),fill_value=-1,dtype=np.int32)
+    engaged = np.zeros(shape=(instances,size),dtype=bool)
+    for i in range(2*iteration):
+        stable_pairs_batch(pools[:,i],pools[:,:i],engaged,preferences,no_of_preferences,null_position,i%2==1,max_set_size)
+        engaged |= pools[:,i]!=-1
+    return np.where(pools==-1,np.nan,pools.astype(np.float64))
+
+@timed("pair_building")
+def build_pairs(names,pools_object):
+    """
+    Build a list of all stable pairs by fetching pairs from each pool_object in the pools_object
+    """
+    import pandas as pd
+    pairs = pd.DataFrame()
+    pairs[0] = names
+
+    for i in range(pools_object.length()):
+        pairs[i+1] = decode_names(names,pools_object.get_pool_object(i).get_all_engagements()) #pd.DataFrame(data=engagements)  
+
+    return(pairs)
+
+def check_if_intersection(set_1,set_2):
+    """
+    Returns true if an intersection between two lists is found, otherwise false
+    """
+    set1 = set(set_1)
+    set2 = set(set_2)
+
+    if ((set1.intersection(set2) != set()) and (not "null" in set1) and(not "null" in set2)):
+        return True
+    else:
+        return False
+
+def get_union(set_1,set_2):
+    """
+    Returns the union of two lists
+    """
+    set1 = set(set_1)
+    set2 = set(set_2)
+    result = set1.union(set2)
+    
+    if "null" in result:
+        result.remove("null")
+    return result
+
+@timed("group_building")
+def build_groups(names,pairs,pools_object):
+    """
+    From the pairs data, build lists of sets and return the set lists (provided there are more than 2 columns)
+    """
+    sets = []
+    pairs = pairs.fillna(value="null")
+    
+    #only perform traverse if we have a minimum of two columns
+    if pairs.shape[1]>1:
+        
+        #create sets for members at first level
+        for i in range(len(names)):
+            result = list(get_union(list([pairs[0][i]]),list([pairs[1][i]])))
+            if result not in sets:
+                sets.append(result)
+        #print("output of level1 join", sets)
+    
+        # Now join level2, level3 etc members and maintain the trees
+        for i in range(2,pools_object.length()+1): #or   #pairs.shape[1]
+            for j in range(len(names)):
+                index_to_join = -1
+                index_to_remove = -1
+    
+                #check if the student is already in a set somewhere else and if so get the index of that set
+                for k in range(len(sets)):
+                    if pairs[i][j] in sets[k]:
+                        index_to_remove = k
+                        if debug: print("index to remove", index_to_remove)
+    
+                #get the index of the set the student is already in 
+                for k in range(len(sets)):
+                    if pairs[0][j] in sets[k]:
+                        index_to_join = k
+                        if debug: print("index to join",index_to_join)
+    
+                if (index_to_join==index_to_remove):
+                    #print("idex to join = index to remove")
+                    pass
+                elif ((index_to_remove!=-1) and (index_to_join!=-1)):
+                    sets[index_to_join] = list(get_union(sets[index_to_join],sets[index_to_remove]))
+                    sets.pop(index_to_remove) 
+    
+    import pandas as pd
+    df = pd.DataFrame(data=sets)
+    df = df.transpose()
+    return df 
+
+def label_components(size,members,partners):
+    """
+    Label each of size members (numbered from 0) with the smallest member joined to it through the pairs (members[i], partners[i])
+    """
+    # hook the larger label onto the smaller one for every pair and shortcut until nothing changes
+    labels = np.arange(size)
+    while True:
+        label_1 = labels[members]
+        label_2 = labels[partners]
+        differ = label_1!=label_2
+        if not differ.any():
+            break
+        np.minimum.at(labels,np.maximum(label_1,label_2)[differ],np.minimum(label_1,label_2)[differ])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped,labels):
+                break
+            labels = jumped
+    return labels
+
+def build_group_labels(pools_object,null_position,size=None):
+    """
+    Label each member with the smallest member index in its group (connected through the engagements of every pool), -1 for the null member.
+    The number of members is taken from the pools unless passed. With no pools there are no groups (every member is labelled -1, as
+    build_groups_from_pools and build_groups give no sets)
+    """
+    if pools_object.length()==0:
+        if size is None:
+            raise ValueError("the number of members is needed to label the groups of an empty Pools object")
+        return np.full(shape=size,fill_value=-1,dtype=np.intp)
+    if size is None:
+        size = len(pools_object.get_pool_object(0).get_partners())
+    members = [np.zeros(shape=0,dtype=np.intp)]
+    partners = [np.zeros(shape=0,dtype=np.intp)]
+    for i in range(pools_object.length()):
+        engaged_to = pools_object.get_pool_object(i).get_partners().astype(np.intp)
+        engaged = np.flatnonzero((engaged_to!=-1) & (engaged_to!=null_position))
+        members.append(engaged)
+        partners.append(engaged_to[engaged]-1)
+    members = np.concatenate(members)
+    partners = np.concatenate(partners)
+    keep = members!=null_position-1
+    labels = label_components(size,members[keep],partners[keep])
+
+    if 0<null_position<=size:
+        labels[null_position-1] = -1
+    return labels
+
+@timed("group_building")
+def build_groups_from_pools(names,pools_object,labels=None):
+    """
+    From the engagements in the pools (or their group labels if passed), build the lists of sets (groups of names ordered by their first member)
+    """
+    if pools_object.length()==0:
+        return []
+
+    if labels is None:
+        labels = build_group_labels(pools_object,return_null_position(names))
+    order = np.argsort(labels,kind="stable")
+    order = order[labels[order]!=-1]
+    starts = np.flatnonzero(np.diff(labels[order]))+1
+    return [[names[member] for member in group] for group in np.split(order,starts)]
+
+def preference_edges(preferences,null_position):
+    """
+    Return the listings (member, listed member) of the preferences, numbered from 0, leaving out the null member and members listing themselves
+    """
+    preferences = np.asarray(preferences)
+    members = np.repeat(np.arange(len(preferences)),preferences.shape[1])
+    listed = preferences.reshape(-1).astype(np.intp)-1
+    keep = (members!=null_position-1) & (listed!=null_position-1) & (listed!=members)
+    return members[keep],listed[keep]
+
+def preference_components(preferences,null_position):
+    """
+    Label each member with the smallest member of its connected component of the preference graph (members joined when either lists the other)
+    """
+    members,listed = preference_edges(preferences,null_position)
+    return label_components(len(preferences),members,listed)
+
+def groups_bounded(preferences,null_position,max_set_size):
+    """
+    Return True if no group can exceed max_set_size, even with the trial engagement of the set size check, so that the check never rejects a
+    proposal. Engagements only join members listing each other, so a group is within a component of the mutual listings (two when joined by a trial)
+    """
+    members,listed = preference_edges(preferences,null_position)
+    if len(members)==0:
+        return max_set_size>=1
+    size = len(preferences)
+    listings = members.astype(np.int64)*size+listed
+    mutual = np.isin(listed.astype(np.int64)*size+members,listings)
+    labels = label_components(size,members[mutual],listed[mutual])
+    sizes = np.bincount(labels,minlength=size)
+    joined = np.where(labels[members]==labels[listed],sizes[labels[members]],sizes[labels[members]]+sizes[labels[listed]])
+    return max(int(sizes.max()),int(joined.max()))<=max_set_size
+
+def components_independent(preferences,null_position,max_set_size):
+    """
+    Return True if the components of the preference graph can be matched separately with the same engagements: no group can exceed
+    max_set_size (the set size check spans components) and the null member is last and lists no one
+    """
+    return ((null_position==len(preferences)) and bool((np.asarray(preferences[null_position-1])==null_position).all())
+            and groups_bounded(preferences,null_position,max_set_size))
+
+def shard_preferences(preferences,names,members,null_position):
+    """
+    Return the preferences and names of the members passed (numbered from 0, in order, whole components) numbered again from 1 with the null member last
+    """
+    shard_members = np.append(members,null_position-1)
+    numbers = np.zeros(shape=len(names)+1,dtype=np.int32)
+    numbers[shard_members+1] = np.arange(1,len(shard_members)+1)
+    return np.ascontiguousarray(numbers[np.asarray(preferences)[shard_members]]),[names[member] for member in shard_members]
+
+def match_shard(preferences,names,iteration,no_of_preferences,max_set_size,engine="sweep"):
+    """
+    Run stable_marriage on the encoded preferences (console output suppressed) and return the partners of each pool (pools x members)
+    """
+    null_position = return_null_position(names)
+    table = sparse_preferences(np.asarray(preferences,dtype=np.int32),null_position)
+    pools_object = Pools()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stable_marriage(pools_object,Proposer(table),table,Acceptor(table),table,iteration,no_of_preferences,null_position,max_set_size,names,engine)
+    return stack_partners(pools_object,len(names))
+
+def stitch_shard(partners,shard_partners,members,null_position):
+    """
+    Copy the engagements of a shard (pools x shard members, null member last) into the partners of the whole cohort (pools x members)
+    """
+    shard_members = np.append(members,null_position-1)
+    shard_partners = shard_partners[:,:len(members)]
+    partners[:,members] = np.where(shard_partners==-1,-1,shard_members[shard_partners-1]+1)
+
+def build_pools(partners):
+    """
+    Return a Pools object with a pool for each row of partners (pools x members, -1 if not engaged)
+    """
+    pools_object = Pools()
+    for row in partners:
+        pool_object = Pool(row)
+        pool_object.partners[:] = row
+        pool_object.unmatched = int(np.count_nonzero(row==-1))
+        pools_object.add_pool(pool_object)
+    return pools_object
+
+def stack_partners(pools_object,size):
+    """
+    Return the engagements of every pool (pools x members), an empty (0, size) array when there are no pools
+    """
+    if pools_object.length()==0:
+        return np.zeros(shape=(0,size),dtype=np.int32)
+    return np.stack([pools_object.get_pool_object(i).get_partners() for i in range(pools_object.length())])
+
+def stable_marriage_sharded(preferences,names,iteration,no_of_preferences,max_set_size,engine="sweep",workers=None,shard_size=1000):
+    """
+    Match the connected components of the preference graph in a pool of worker processes and return the Pools of the whole cohort, the
+    same as stable_marriage finds. Components are gathered in order into shards of at least shard_size members. When the components are
+    not independent (see components_independent) the cohort is matched in one piece
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    preferences = np.asarray(preferences,dtype=np.int32)
+    null_position = return_null_position(names)
+    if not components_independent(preferences,null_position,max_set_size):
+        return build_pools(match_shard(preferences,names,iteration,no_of_preferences,max_set_size,engine))
+
+    members = np.flatnonzero(np.arange(len(names))!=null_position-1)
+    labels = preference_components(preferences,null_position)[members]
+    order = np.argsort(labels,kind="stable")
+    components = np.split(members[order],np.flatnonzero(np.diff(labels[order]))+1)
+    shards = []
+    shard = []
+    for component in components:
+        shard.append(component)
+        if sum(len(component) for component in shard)>=shard_size:
+            shards.append(np.sort(np.concatenate(shard)))
+            shard = []
+    if shard:
+        shards.append(np.sort(np.concatenate(shard)))
+
+    partners = np.full(shape=(2*iteration,len(names)),fill_value=-1,dtype=np.int32)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(match_shard,*shard_preferences(preferences,names,shard,null_position),iteration,no_of_preferences,max_set_size,engine) for shard in shards]
+        for shard,future in zip(shards,futures):
+            stitch_shard(partners,future.result(),shard,null_position)
+    return build_pools(partners)
+
+def rematch(pools_object,preferences,changes,names,max_set_size,engine="sweep"):
+    """
+    Apply the changed preference rows (a dictionary of member number to new encoded row) to a matched cohort and return the new preferences,
+    the Pools of a fresh run on them and the numbers of the members matched again. Only the components of the preference graph holding a
+    changed member are matched again, the other engagements are kept. Falls back to matching every member when the components are not
+    independent (see components_independent) before or after the change.
+    The cost only follows the size of the change for cohorts that split into many small components whose groups cannot outgrow
+    max_set_size, e.g. departments that never list each other. A class with mixed preferences usually forms one large component, which
+    is matched again whole, and with a small max_set_size the components are rarely independent, so every member is matched again
+    """
+    iteration = pools_object.length()//2
+    no_of_preferences = preferences.shape[1]
+    null_position = return_null_position(names)
+    if null_position in changes:
+        raise ValueError("the preferences of the null member cannot be changed")
+
+    new_preferences = np.array(preferences,dtype=np.int32)
+    for member,row in changes.items():
+        new_preferences[member-1] = row
+    changed = np.array(sorted(changes),dtype=np.intp)-1
+
+    if not (components_independent(preferences,null_position,max_set_size) and components_independent(new_preferences,null_position,max_set_size)):
+        members = np.flatnonzero(np.arange(len(names))!=null_position-1)
+        return new_preferences,build_pools(match_shard(new_preferences,names,iteration,no_of_preferences,max_set_size,engine)),members+1
+
+    # match again every component that held or now holds a changed member and keep the other engagements
+    old_labels = preference_components(preferences,null_position)
+    new_labels = preference_components(new_preferences,null_position)
+    affected = np.isin(old_labels,old_labels[changed]) | np.isin(new_labels,new_labels[changed])
+    members = np.flatnonzero(np.isin(new_labels,new_labels[affected]) & (np.arange(len(names))!=null_position-1))
+
+    partners = stack_partners(pools_object,len(names))
+    shard_partners = match_shard(*shard_preferences(new_preferences,names,members,null_position),iteration,no_of_preferences,max_set_size,engine)
+    stitch_shard(partners,shard_partners,members,null_position)
+    return new_preferences,build_pools(partners),members+1
+
+def update_group_labels(labels,pools_object,members,null_position):
+    """
+    Return the group labels (see build_group_labels) with the groups of the members passed, whole groups as returned by rematch, labelled again from the pools
+    """
+    labels = np.array(labels)
+    members = np.asarray(members,dtype=np.intp)
+    pairs = []
+    partners = []
+    for i in range(pools_object.length()):
+        engaged_to = pools_object.get_pool_object(i).get_partners()[members-1].astype(np.intp)
+        engaged = (engaged_to!=-1) & (engaged_to!=null_position)
+        pairs.append(members[engaged]-1)
+        partners.append(engaged_to[engaged]-1)
+    new_labels = label_components(len(labels),np.concatenate(pairs),np.concatenate(partners))
+    labels[members-1] = new_labels[members-1]
+    return labels
+
+def write_csv(names,pools_object,labels,output_file_stable_pairs='pools.csv',output_file_sets='sets.csv',echo=True):
+    """
+    Write the pairs (a column per pool) and the sets (a set is a column) csv files, printing the tables if echo. Return the number of sets
+    """
+    pairs = build_pairs(names,pools_object)
+    if echo:
+        print("\n Writing pairs to file (1st iteration row 1 - 2, 2nd iteration 1 - 3 etc.)\n {}".format(pairs))
+    pairs.to_csv(output_file_stable_pairs)
+
+    import pandas as pd
+    groups = pd.DataFrame(data=build_groups_from_pools(names,pools_object,labels)).transpose()
+    if echo:
+        print("\n Writing sets to file (a set is a column)\n {}".format(groups))
+        print("length of groups", len(groups))
+    groups.to_csv(output_file_sets)
+    return len(groups.columns)
+
+def save_pools(output_file,pools_object,names,labels=None):
+    """
+    Write the engagements of every pool (pools x members, -1 if not engaged) to a .npy file, or to a .npz file with the names and the group labels
+    """
+    partners = stack_partners(pools_object,len(names))
+    if output_file.endswith(".npy"):
+        np.save(output_file,partners)
+        return
+    if labels is None:
+        labels = build_group_labels(pools_object,return_null_position(names),len(names))
+    np.savez(output_file,partners=partners,names=np.array(names,dtype=str),labels=np.asarray(labels,dtype=np.int64))
+
+def load_pools(input_file,names=None):
+    """
+    Return the Pools object, the names and the group labels saved by save_pools (the names must be passed for a .npy file)
+    """
+    if input_file.endswith(".npy"):
+        if names is None:
+            raise ValueError("the names are needed to read {}".format(input_file))
+        pools_object = build_pools(np.load(input_file))
+        return pools_object,list(names),build_group_labels(pools_object,return_null_position(names),len(names))
+    with np.load(input_file) as saved:
+        return build_pools(saved["partners"]),saved["names"].tolist(),saved["labels"]
+
+def write_group_table(output_file,names,labels,chunk_size=65536):
+    """
+    Write the sets as a long table with a row (group_id, member) per member, in the order of the columns of the sets csv. A .npy file holds
+    the member numbers (from 1) in an int32 array of two columns, any other file is a csv of the names written chunk_size rows at a time.
+    Return the number of sets
+    """
+    labels = np.asarray(labels)
+    order = np.argsort(labels,kind="stable")
+    order = order[labels[order]!=-1]
+    group_ids = np.zeros(shape=len(order),dtype=np.int32)
+    group_ids[1:] = np.cumsum(np.diff(labels[order])!=0)
+
+    if output_file.endswith(".npy"):
+        np.save(output_file,np.column_stack((group_ids,order+1)).astype(np.int32))
+    else:
+        with open(output_file,"w",newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["group_id","member"])
+            for start in range(0,len(order),chunk_size):
+                writer.writerows(zip(group_ids[start:start+chunk_size].tolist(),[names[member] for member in order[start:start+chunk_size]]))
+    return int(group_ids[-1])+1 if len(order) else 0
+
+def export_csv(pools_file,output_file_stable_pairs='pools.csv',output_file_sets='sets.csv',names=None):
+    """
+    Write the pairs and sets csv files of a run from the engagements saved by save_pools, the same files the run writes with output_format csv
+    """
+    pools_object,names,labels = load_pools(pools_file,names)
+    return write_csv(names,pools_object,labels,output_file_stable_pairs,output_file_sets,echo=False)
+
+def run(input_file,iteration,no_of_preferences,max_set_size,output_file_stable_pairs='pools.csv',output_file_sets='sets.csv',stats_file=None,profile=False,checkpoint_file=None,cache_dir=None,cache_bytes=1<<30,workers=None,output_format="csv",echo=True):
+    """
+    Match the preferences in input_file and write the pairs and the sets to the output files passed, return the number of sets.
+    With a checkpoint_file the Pools are saved after each iteration, and a run is resumed from the file if it exists. With a
+    cache_dir the result is looked up in (and added to) a ResultCache of at most cache_bytes and the algorithm is skipped on a hit.
+    With workers (a number of processes) a fresh run matches the components of the preference graph in parallel (stable_marriage_sharded).
+    With output_format "binary" the engagements are saved to output_file_stable_pairs with save_pools (.npz or .npy) and the sets to
+    output_file_sets as a long table (write_group_table), the csv files can be written from them later with export_csv. Without echo the
+    preferences, pairs and sets are not printed
+    """
+    # Import and Encode the preferences data
+    preferences,names = read_preferences(input_file,no_of_preferences) 
+    if echo:
+        print("\n Input file with {} preferences read and encoded successfully as \n {}".format(no_of_preferences, preferences))
+
+    null_position = return_null_position(names)
+    print("\n Instantiating Acceptor and Proposer objects with input preference data... \n")
+    acceptors_table = sparse_preferences(preferences,null_position)
+    #acceptors_table = [[1,3,2,4],[3,4,1,2],[4,2,3,1],[3,2,1,4]]
+    proposers_table = acceptors_table
+
+    # Instantiate the Acceptor and Proposer class objects
+    accepter_object = Acceptor(acceptors_table)
+    proposer_object = Proposer(proposers_table)
+    print("\n Instantiating Pool and Pools objects ready to hold engagements... \n")
+
+    # Instantiate the Pools Class object, from the cache or resuming from the checkpoint if there is one
+    cached = None
+    labels = None
+    if cache_dir:
+        cache = ResultCache(cache_dir,cache_bytes)
+        key = match_key(preferences,names,iteration,no_of_preferences,max_set_size)
+        cached = cache.get(key)
+    if cached:
+        pools_object,labels = cached
+        print("\n Result found in cache {} \n".format(cache.path(key)))
+    elif checkpoint_file and os.path.exists(checkpoint_file):
+        pools_object,completed = load_checkpoint(checkpoint_file,names,preferences,no_of_preferences,max_set_size,iteration)
+        print("\n Resuming after iteration {} from {} \n".format(completed,checkpoint_file))
+    else:
+        pools_object = Pools()
+    if stats_file:
+        stats_object = start_stats()
+
+    # Run the Algorithm (unless the result was cached)
+    if not cached:
+        print("\n Finding Stable Pairs with {} iterations of the algorithm... \n".format(iteration))
+        if workers and pools_object.length()==0:
+            pools_object = stable_marriage_sharded(preferences,names,iteration,no_of_preferences,max_set_size,"sweep",workers)
+            if checkpoint_file:
+                save_checkpoint(checkpoint_file,pools_object,names,preferences,iteration,no_of_preferences,max_set_size)
+        elif stats_file and profile:
+            stats_object.profile(stable_marriage,pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,iteration,no_of_preferences,null_position,max_set_size,names,"sweep",checkpoint_file,echo)
+        else:
+            stable_marriage(pools_object,proposer_object,proposers_table,accepter_object,acceptors_table,iteration,no_of_preferences,null_position,max_set_size,names,"sweep",checkpoint_file,echo)
+        if cache_dir:
+            labels = build_group_labels(pools_object,null_position,len(names))
+            cache.put(key,pools_object,labels)
+
+    # Write the engagements and the sets to file
+    if output_format=="binary":
+        if labels is None:
+            labels = build_group_labels(pools_object,null_position,len(names))
+        save_pools(output_file_stable_pairs,pools_object,names,labels)
+        number_of_sets = write_group_table(output_file_sets,names,labels)
+        print("\n Engagements written to {} and {} sets to {}".format(output_file_stable_pairs,number_of_sets,output_file_sets))
+    else:
+        number_of_sets = write_csv(names,pools_object,labels,output_file_stable_pairs,output_file_sets,echo)
+
+    if stats_file:
+        stop_stats().dump(stats_file)
+        print("\n Counters and timings written to {}".format(stats_file))
+    return number_of_sets
+
+def main():
+
+    try:
+        input_file = "Preferences4.csv"
+        #input_file = sys.argv[1]
+        iteration = 2
+        #iteration = int(sys.argv[2]) # Number of runs of stable pairs algoirthm. Subsequent runs ignore stable pairs already built.
+        no_of_preferences = 5
+        #no_of_preferences = int(sys.argv[3]) # Number of preferences to read from input file
+        max_set_size = 12
+        #max_set_size = int(sys.argv[4]) # Maximum number in a set
+        stats_file = None
+        #stats_file = "stats.json" # Write the counters and phase timings of the run to file
+        profile = False # Also run the algorithm under cProfile (with stats_file)
+        checkpoint_file = None
+        #checkpoint_file = "checkpoint.npz" # Save the pools after each iteration and resume from the file when run again
+        cache_dir = None
+        #cache_dir = "match_cache" # Reuse the result of an earlier run with the same preferences and parameters
+        workers = None
+        #workers = 4 # Match the independent components of the preference graph in parallel processes
+        output_format = "csv"
+        #output_format = "binary" # Write pools.npz (engagement arrays) and groups.csv (group_id, member) instead of pools.csv and sets.csv
+        echo = True # Print the preferences, pairs and sets
+        
+    except: 
+        print("stableGroups.py --[input_file] --[iteration] --[no_of_preferences] --[max_set_size]\n")
+        print("--[input_file] \n input file in csv format \n")
+        print("--[iteration] \n number of runs of Stable Pairs Algorithm \n")
+        print("--[no_of_preferences] \n number of preferences to read from input file \n")
+        print("--[max_set_size] \n maximum size of a set \n")
+        sys.exit()
+    else: pass
+
+    if output_format=="binary":
+        run(input_file,iteration,no_of_preferences,max_set_size,'pools.npz','groups.csv',stats_file,profile,checkpoint_file,cache_dir,workers=workers,output_format=output_format,echo=echo)
+    else:
+        run(input_file,iteration,no_of_preferences,max_set_size,'pools.csv','sets.csv',stats_file,profile,checkpoint_file,cache_dir,workers=workers,echo=echo)
+
+if __name__ == "__main__":
+    main()
+
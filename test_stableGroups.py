@@ -0,0 +1,64 @@
+"""
+#
+#  Tests for the many-to-one mode of stableGroups, run with python -m pytest or python -m unittest
+#
+"""
+
+import io
+import contextlib
+import unittest
+import numpy as np
+
+with contextlib.redirect_stdout(io.StringIO()): #the module runs its demonstration when imported
+    import stableGroups as sg
+
+def random_instance(rng,proposers,acceptors):
+    """
+    Return random incomplete preference lists: for each proposer a list of acceptors and for each acceptor a list of proposers (numbered from 1)
+    """
+    proposers_table = [(rng.permutation(acceptors)[:int(rng.integers(1,acceptors+1))]+1).tolist() for proposer in range(proposers)]
+    acceptors_table = [(rng.permutation(proposers)[:int(rng.integers(1,proposers+1))]+1).tolist() for acceptor in range(acceptors)]
+    return proposers_table,acceptors_table
+
+def rank(table,member,other):
+    """
+    Return the position of other in the list of member (numbered from 1), None if not listed
+    """
+    row = table[member-1]
+    return row.index(other) if other in row else None
+
+# StableGroupsTest Class :: the capacity mode gives stable groups within max_set_size
+class StableGroupsTest(unittest.TestCase):
+    def test_groups_are_stable_and_within_capacity(self):
+        rng = np.random.default_rng(0)
+        for i in range(300):
+            proposers = int(rng.integers(1,15))
+            acceptors = int(rng.integers(1,8))
+            max_set_size = int(rng.integers(1,5))
+            proposers_table,acceptors_table = random_instance(rng,proposers,acceptors)
+            pool_object = sg.CapacityPool(proposers_table,[max_set_size-1]*acceptors)
+            groups = sg.stable_groups(sg.Proposer(proposers_table),sg.CapacityAcceptor(acceptors_table),pool_object)
+
+            held = {acceptor: [] for acceptor in range(1,acceptors+1)}
+            for group in groups:
+                held[group[0]] = group[1:]
+            engaged_to = {}
+            for acceptor in held:
+                self.assertLessEqual(len(held[acceptor]),max_set_size-1)
+                for proposer in held[acceptor]:
+                    self.assertNotIn(proposer,engaged_to)
+                    self.assertIsNotNone(rank(proposers_table,proposer,acceptor))
+                    self.assertIsNotNone(rank(acceptors_table,acceptor,proposer))
+                    engaged_to[proposer] = acceptor
+
+            # no proposer and acceptor listing each other would both rather be together
+            for proposer in range(1,proposers+1):
+                for acceptor in proposers_table[proposer-1]:
+                    if (engaged_to.get(proposer)==acceptor) or (rank(acceptors_table,acceptor,proposer) is None) or (max_set_size<2):
+                        continue
+                    proposer_prefers = (proposer not in engaged_to) or (rank(proposers_table,proposer,acceptor)<rank(proposers_table,proposer,engaged_to[proposer]))
+                    acceptor_prefers = (len(held[acceptor])<max_set_size-1) or any(rank(acceptors_table,acceptor,proposer)<rank(acceptors_table,acceptor,other) for other in held[acceptor])
+                    self.assertFalse(proposer_prefers and acceptor_prefers,(proposer,acceptor))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,414 @@
+"""
+#
+#  Tests for stableGroupsX4, run with python -m pytest or python -m unittest
+#
+"""
+
+import io
+import os
+import csv
+import copy
+import tempfile
+import contextlib
+import concurrent.futures
+import unittest
+from unittest import mock
+import numpy as np
+import stableGroupsX4 as sg
+
+def random_cohort(rng,size,no_of_preferences,skew=0.0,null_rate=0.1):
+    """
+    Return the encoded preferences (null member last, listing only itself) and the names of a random cohort. Members are listed with
+    popularity proportional to 1/rank**skew (0 for uniform) and each listing is the null member with probability null_rate
+    """
+    popularity = np.cumsum(1.0/np.arange(1,size+1)**skew)
+    popularity /= popularity[-1]
+    order = rng.permutation(size)
+    preferences = np.empty(shape=(size+1,no_of_preferences),dtype=np.int32)
+    preferences[:size] = order[np.searchsorted(popularity,rng.random(size=(size,no_of_preferences)),side="right")]+1
+    preferences[:size][rng.random(size=(size,no_of_preferences))<null_rate] = size+1
+    preferences[size] = size+1
+    return preferences,["member{}".format(i+1) for i in range(size)]+["null"]
+
+def department_cohort(rng,size,no_of_preferences,departments,null_rate=0.1):
+    """
+    Return the encoded preferences and names of a random cohort where each member only lists members of their own department
+    """
+    department = rng.integers(departments,size=size)
+    preferences = np.empty(shape=(size+1,no_of_preferences),dtype=np.int32)
+    for member in range(size):
+        preferences[member] = rng.choice(np.flatnonzero(department==department[member]),size=no_of_preferences)+1
+    preferences[rng.random(size=(size+1,no_of_preferences))<null_rate] = size+1
+    preferences[size] = size+1
+    return preferences,["member{}".format(i+1) for i in range(size)]+["null"]
+
+def match(preferences,names,iteration,no_of_preferences,max_set_size,engine="sweep"):
+    """
+    Run stable_marriage on the encoded preferences (console output suppressed) and return the Pools object
+    """
+    pools_object = sg.Pools()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sg.stable_marriage(pools_object,sg.Proposer(preferences),preferences,sg.Acceptor(preferences),preferences,iteration,no_of_preferences,sg.return_null_position(names),max_set_size,names,engine)
+    return pools_object
+
+def partners(pools_object):
+    """
+    Return the engagements of every pool (pools x members)
+    """
+    return np.stack([pools_object.get_pool_object(i).get_partners() for i in range(pools_object.length())])
+
+def write_cohort(input_file,preferences,names):
+    """
+    Write encoded preferences to a csv file in the import_preferences format
+    """
+    with open(input_file,"w",newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["name"]+["preference{}".format(i+1) for i in range(preferences.shape[1])])
+        for name,row in zip(names,preferences):
+            writer.writerow([name]+[names[member-1] for member in row])
+
+def run(*args,**kwargs):
+    """
+    Call stableGroupsX4.run with the console output suppressed
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sg.run(*args,**kwargs)
+
+def read_file(path):
+    """
+    Return the text of a file
+    """
+    with open(path) as textfile:
+        return textfile.read()
+
+def cohorts(seed,count):
+    """
+    Yield count seeded random cohorts with their parameters (preferences, names, iteration, no_of_preferences, max_set_size). Small values
+    of max_set_size are included so that the set size check rejects proposals
+    """
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        size = int(rng.integers(5,80))
+        no_of_preferences = int(rng.integers(1,6))
+        skew = float(rng.choice([0.0,1.0,2.0]))
+        preferences,names = random_cohort(rng,size,no_of_preferences,skew)
+        yield preferences,names,int(rng.integers(1,4)),no_of_preferences,int(rng.choice([1,2,3,4,12,size+1]))
+
+# EngineTest Class :: the pair engines find the same engagements
+class EngineTest(unittest.TestCase):
+    def test_queue_matches_sweep(self):
+        limited = 0
+        for preferences,names,iteration,no_of_preferences,max_set_size in cohorts(0,150):
+            sweep = partners(match(preferences,names,iteration,no_of_preferences,max_set_size,"sweep"))
+            queue = partners(match(preferences,names,iteration,no_of_preferences,max_set_size,"queue"))
+            np.testing.assert_array_equal(sweep,queue)
+            if not np.array_equal(sweep,partners(match(preferences,names,iteration,no_of_preferences,len(names),"sweep"))):
+                limited += 1
+        self.assertGreater(limited,0,"no cohort had a proposal rejected by the set size check")
+
+    def test_debug_output_on_sparse_preferences(self):
+        preferences,names = random_cohort(np.random.default_rng(9),20,3)
+        sparse = sg.sparse_preferences(preferences,sg.return_null_position(names))
+        with mock.patch.object(sg,"debug",True):
+            for engine in ("sweep","queue"):
+                np.testing.assert_array_equal(partners(match(sparse,names,2,3,4,engine)),partners(match(preferences,names,2,3,4,engine)))
+
+# ShardTest Class :: matching the components of the preference graph separately gives the engagements of stable_marriage
+class ShardTest(unittest.TestCase):
+    def test_sharded_matches_stable_marriage(self):
+        rng = np.random.default_rng(12)
+        executors = []
+        process_pool = concurrent.futures.ProcessPoolExecutor
+
+        def counted(*args,**kwargs):
+            executors.append(kwargs)
+            return process_pool(*args,**kwargs)
+
+        counts = {True: 0, False: 0}
+        with mock.patch("concurrent.futures.ProcessPoolExecutor",counted):
+            for i in range(30):
+                size = int(rng.integers(20,120))
+                no_of_preferences = int(rng.integers(2,5))
+                iteration = int(rng.integers(1,4))
+                max_set_size = int(rng.choice([2,4,12,size+1]))
+                preferences,names = department_cohort(rng,size,no_of_preferences,int(rng.integers(1,20)))
+                independent = sg.components_independent(preferences,size+1,max_set_size)
+                counts[independent] += 1
+
+                del executors[:]
+                pools_object = sg.stable_marriage_sharded(preferences,names,iteration,no_of_preferences,max_set_size,"sweep" if i%2 else "queue",workers=2,shard_size=3)
+                np.testing.assert_array_equal(partners(pools_object),partners(match(preferences,names,iteration,no_of_preferences,max_set_size)))
+                # the shards run in worker processes, the fallback matches the whole cohort in this process
+                self.assertEqual(len(executors),1 if independent else 0)
+        self.assertGreater(counts[True],0)
+        self.assertGreater(counts[False],0)
+
+def rebuilt_set_size_allowed(acceptors_table,pool_object,names,preference,proposer,proposer_object,pools_object,max_set_size):
+    """
+    The set size check as it was before the groups were tracked: copy the pools, add the trial engagement and build every group again
+    """
+    pool_test = copy.deepcopy(pool_object)
+    pool_test.new_engagement(proposer_object.get_proposal(proposer,preference),proposer+1)
+    pools_test = copy.deepcopy(pools_object)
+    pools_test.add_pool(pool_test)
+    return len(sg.build_groups(names,sg.build_pairs(names,pools_test),pools_test))<=max_set_size
+
+def merge_overlapping(sets):
+    """
+    Return the sets (sorted lists) merged wherever they share a member
+    """
+    merged = []
+    for names in sets:
+        names = set(names)
+        for other in [other for other in merged if other&names]:
+            merged.remove(other)
+            names |= other
+        merged.append(names)
+    return sorted(sorted(names) for names in merged)
+
+# GroupsTest Class :: the groups built from the pool engagements are the groups of build_groups
+class GroupsTest(unittest.TestCase):
+    def test_groups_match_build_groups(self):
+        rng = np.random.default_rng(7)
+        differences = 0
+        for i in range(300):
+            size = int(rng.integers(2,41))
+            names = ["m{}".format(member) for member in range(size)]
+            names.insert(int(rng.integers(size+1)),"null")
+            pools_object = sg.Pools()
+            for pool in range(int(rng.integers(0,6))):
+                pool_object = sg.Pool(names)
+                for engagement in range(int(rng.integers(0,len(names)+1))):
+                    pool_object.new_engagement(int(rng.integers(1,len(names)+1)),int(rng.integers(1,len(names)+1)))
+                pools_object.add_pool(pool_object)
+
+            groups = sorted(sorted(group) for group in sg.build_groups_from_pools(names,pools_object))
+            frame = sg.build_groups(names,sg.build_pairs(names,pools_object),pools_object)
+            expected = sorted(sorted(str(name) for name in frame[column] if (name is not None) and (name==name)) for column in frame.columns)
+            expected = [group for group in expected if group]
+
+            # build_groups can emit a pair already joined into a group (depending on the string hash order of list(set(...))) and the
+            # sets holding such a pair are not always merged, the groups are then the sets merged wherever they share a member
+            if sum(len(group) for group in expected)==len(set(name for group in expected for name in group)):
+                self.assertEqual(groups,expected)
+            else:
+                differences += 1
+                self.assertEqual(groups,merge_overlapping(expected))
+        self.assertLess(differences,100)
+
+# SetSizeTest Class :: the tracked groups give the accept/reject decisions of a full rebuild
+class SetSizeTest(unittest.TestCase):
+    def test_decisions_match_rebuild(self):
+        checked = []
+        is_set_size_allowed = sg.is_set_size_allowed
+
+        def both(*args):
+            expected = rebuilt_set_size_allowed(*args)
+            self.assertEqual(is_set_size_allowed(*args),expected)
+            checked.append(expected)
+            return expected
+
+        rng = np.random.default_rng(6)
+        with mock.patch.object(sg,"is_set_size_allowed",both):
+            for i in range(30):
+                size = int(rng.integers(4,13))
+                no_of_preferences = int(rng.integers(1,5))
+                preferences,names = random_cohort(rng,size,no_of_preferences,float(rng.choice([0.0,1.0,2.0])))
+                match(preferences,names,int(rng.integers(1,4)),no_of_preferences,int(rng.integers(1,13)),"sweep" if i%2 else "queue")
+        self.assertIn(False,checked)
+        self.assertIn(True,checked)
+
+# RematchTest Class :: matching again after a change gives the engagements and groups of a fresh run
+class RematchTest(unittest.TestCase):
+    def test_rematch_matches_fresh_run(self):
+        rng = np.random.default_rng(8)
+        partial = 0
+        for i in range(200):
+            size = int(rng.integers(20,200))
+            no_of_preferences = int(rng.integers(2,5))
+            iteration = int(rng.integers(1,4))
+            max_set_size = int(rng.integers(2,30))
+            preferences,names = department_cohort(rng,size,no_of_preferences,int(rng.integers(1,30)))
+            null_position = size+1
+            changes = {}
+            for member in rng.choice(size,size=int(rng.integers(1,4)),replace=False):
+                changes[int(member)+1] = rng.integers(1,size+2,size=no_of_preferences).astype(np.int32) if rng.random()<0.5 else preferences[rng.integers(size)]
+
+            old_pools = match(preferences,names,iteration,no_of_preferences,max_set_size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                new_preferences,new_pools,members = sg.rematch(old_pools,preferences,changes,names,max_set_size,"sweep" if i%2 else "queue")
+            fresh_pools = match(new_preferences,names,iteration,no_of_preferences,max_set_size)
+            np.testing.assert_array_equal(partners(new_pools),partners(fresh_pools))
+            labels = sg.update_group_labels(sg.build_group_labels(old_pools,null_position),new_pools,members,null_position)
+            np.testing.assert_array_equal(labels,sg.build_group_labels(fresh_pools,null_position))
+            partial += len(members)<size
+        self.assertGreater(partial,0,"every rematch fell back to matching all members")
+
+def stable_matchings(lists):
+    """
+    Yield every stable matching (member: partner, None if unmatched) of a stable roommates instance by brute force
+    """
+    members = sorted(lists)
+    rank = {member: {other: position for position,other in enumerate(lists[member])} for member in members}
+
+    def prefers(member,other,matching):
+        return (matching[member] is None) or (rank[member][other]<rank[member][matching[member]])
+
+    def matchings(remaining,matching):
+        if not remaining:
+            yield dict(matching)
+            return
+        member = remaining[0]
+        matching[member] = None
+        yield from matchings(remaining[1:],matching)
+        for other in lists[member]:
+            if other in remaining[1:]:
+                matching[member],matching[other] = other,member
+                yield from matchings([rest for rest in remaining[1:] if rest!=other],matching)
+                matching[other] = None
+        del matching[member]
+
+    for matching in matchings(members,{}):
+        if not any(prefers(member,other,matching) and prefers(other,member,matching) for member in members for other in lists[member] if matching[member]!=other):
+            yield matching
+
+# RoommatesTest Class :: Irving's algorithm finds a stable matching whenever one exists
+class RoommatesTest(unittest.TestCase):
+    def pair(self,preferences,names,sparse=False):
+        null_position = sg.return_null_position(names)
+        table = sg.sparse_preferences(preferences,null_position) if sparse else preferences
+        pools_object = sg.Pools()
+        pool_object = sg.stable_roommates(sg.Pool(table),pools_object,sg.Proposer(table),table,sg.Acceptor(table),table,preferences.shape[1],null_position,False,len(names),names)
+        return pool_object.get_partners()
+
+    def test_stable_against_brute_force(self):
+        rng = np.random.default_rng(10)
+        unsolvable = 0
+        for i in range(300):
+            size = int(rng.integers(2,9))
+            no_of_preferences = int(rng.integers(1,size+1))
+            preferences,names = random_cohort(rng,size,no_of_preferences,float(rng.choice([0.0,1.0])))
+            lists = sg.roommate_lists(sg.Pools(),sg.Proposer(preferences),preferences,no_of_preferences,size+1,False)
+            stable = list(stable_matchings(lists))
+            try:
+                engaged_to = self.pair(preferences,names)
+            except sg.NoStableMatching:
+                self.assertEqual(stable,[])
+                unsolvable += 1
+                continue
+            matching = {member: (int(engaged_to[member-1]) if engaged_to[member-1]!=-1 else None) for member in lists}
+            self.assertIn(matching,stable)
+            np.testing.assert_array_equal(self.pair(preferences,names,True),engaged_to)
+        self.assertGreater(unsolvable,0)
+
+    def test_no_stable_matching(self):
+        # 1, 2 and 3 each prefer the next one round the cycle and all rank 4 last
+        names = ["a","b","c","d","null"]
+        preferences = np.array([[2,3,4],[3,1,4],[1,2,4],[1,2,3],[5,5,5]],dtype=np.int32)
+        for sparse in (False,True):
+            with self.assertRaises(sg.NoStableMatching):
+                self.pair(preferences,names,sparse)
+
+    def test_sparse_preferences_through_stable_marriage(self):
+        for preferences,names,iteration,no_of_preferences,max_set_size in cohorts(11,30):
+            sparse = sg.sparse_preferences(preferences,sg.return_null_position(names))
+            try:
+                dense = partners(match(preferences,names,iteration,no_of_preferences,max_set_size,"roommates"))
+            except sg.NoStableMatching:
+                self.assertRaises(sg.NoStableMatching,match,sparse,names,iteration,no_of_preferences,max_set_size,"roommates")
+                continue
+            np.testing.assert_array_equal(partners(match(sparse,names,iteration,no_of_preferences,max_set_size,"roommates")),dense)
+
+# BatchTest Class :: the batched engine finds the engagements of stable_marriage on each instance
+class BatchTest(unittest.TestCase):
+    def test_batch_matches_scalar(self):
+        rng = np.random.default_rng(4)
+        for i in range(12):
+            size = int(rng.integers(5,60))
+            no_of_preferences = int(rng.integers(1,6))
+            iteration = int(rng.integers(1,4))
+            max_set_size = int(rng.choice([1,2,3,4,12,size+1]))
+            instances = [random_cohort(rng,size,no_of_preferences,float(rng.choice([0.0,1.0,2.0]))) for instance in range(int(rng.integers(1,8)))]
+            names = instances[0][1]
+            preferences = np.stack([instance[0] for instance in instances])
+            batch = sg.stable_marriage_batch(preferences,iteration,no_of_preferences,sg.return_null_position(names),max_set_size)
+            for instance in range(len(preferences)):
+                pools_object = match(preferences[instance],names,iteration,no_of_preferences,max_set_size)
+                scalar = np.array([pools_object.get_pool_object(i).get_all_engagements() for i in range(pools_object.length())])
+                np.testing.assert_array_equal(scalar,batch[instance])
+
+# CheckpointTest Class :: a run resumed from a checkpoint writes the same files as a full run
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_file = self.path("cohort.csv")
+        preferences,names = random_cohort(np.random.default_rng(2),60,5,skew=1.0)
+        write_cohort(self.input_file,preferences,names)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self,name):
+        return os.path.join(self.directory.name,name)
+
+    def assertSameOutput(self,iteration,checkpoint_iterations):
+        checkpoint_file = self.path("checkpoint.npz")
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        run(self.input_file,checkpoint_iterations,5,4,self.path("ignored_pools.csv"),self.path("ignored_sets.csv"),checkpoint_file=checkpoint_file)
+        run(self.input_file,iteration,5,4,self.path("resumed_pools.csv"),self.path("resumed_sets.csv"),checkpoint_file=checkpoint_file)
+        run(self.input_file,iteration,5,4,self.path("full_pools.csv"),self.path("full_sets.csv"))
+        for output in ("pools","sets"):
+            self.assertEqual(read_file(self.path("resumed_{}.csv".format(output))),read_file(self.path("full_{}.csv".format(output))))
+
+    def test_resume_with_more_iterations(self):
+        self.assertSameOutput(3,1)
+
+    def test_resume_with_fewer_iterations(self):
+        self.assertSameOutput(1,3)
+
+# OutputTest Class :: the binary outputs reproduce the csv files of a run
+class OutputTest(unittest.TestCase):
+    def test_export_matches_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = lambda name: os.path.join(directory,name)
+            preferences,names = random_cohort(np.random.default_rng(5),300,4,skew=1.0)
+            write_cohort(path("cohort.csv"),preferences,names)
+            for iteration in (0,2):
+                run(path("cohort.csv"),iteration,4,3,path("pools.csv"),path("sets.csv"))
+                for pools_file,table_file in (("pools.npz","groups.csv"),("pools.npy","groups.npy")):
+                    output = io.StringIO()
+                    with contextlib.redirect_stdout(output):
+                        sets = sg.run(path("cohort.csv"),iteration,4,3,path(pools_file),path(table_file),output_format="binary",echo=False)
+                    self.assertLess(len(output.getvalue()),1000) #status lines only
+                    sg.export_csv(path(pools_file),path("exported_pools.csv"),path("exported_sets.csv"),names)
+                    for output_file in ("pools.csv","sets.csv"):
+                        self.assertEqual(read_file(path(output_file)),read_file(path("exported_"+output_file)))
+                    self.assertEqual(sets,len(read_file(path("sets.csv")).splitlines()[0].split(","))-1)
+                    if table_file.endswith(".npy"):
+                        group_ids = np.load(path(table_file))[:,0]
+                    else:
+                        group_ids = [row.split(",")[0] for row in read_file(path(table_file)).splitlines()[1:]]
+                    self.assertEqual(sets,len(np.unique(group_ids)))
+                if iteration==0:
+                    self.assertEqual(sets,0)
+
+# CacheTest Class :: results are stored in and read back from a ResultCache
+class CacheTest(unittest.TestCase):
+    def test_cached_run_writes_the_same_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory,"cohort.csv")
+            preferences,names = random_cohort(np.random.default_rng(3),40,4,skew=1.0)
+            write_cohort(input_file,preferences,names)
+            cache_dir = os.path.join(directory,"cache")
+            for iteration in (0,2):
+                outputs = []
+                for name in ("stored","cached"):
+                    outputs.append([os.path.join(directory,"{}_{}.csv".format(name,output)) for output in ("pools","sets")])
+                    run(input_file,iteration,4,3,*outputs[-1],cache_dir=cache_dir)
+                for stored,cached in zip(*outputs):
+                    self.assertEqual(read_file(stored),read_file(cached))
+            self.assertEqual(len(os.listdir(cache_dir)),3) #two results and the lock file
+
+if __name__ == "__main__":
+    unittest.main()